@@ -9,18 +9,286 @@ Ultra-simple interface for P2P cluster membership:
 """
 
 import asyncio
+import hashlib
+import json
 import logging
-from typing import List, Optional
+import os
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional, Tuple
+
 from dstack_sdk import DstackClient
 from signature_proof import SignatureProofGenerator
 
-from web3 import Web3
+import aiohttp
+from eth_abi import decode as abi_decode, encode as abi_encode
+from eth_account import Account
+from eth_account.datastructures import SignedTransaction
+from eth_account.signers.local import LocalAccount
+from eth_utils import keccak
+from hexbytes import HexBytes
+from web3 import AsyncHTTPProvider, AsyncWeb3, WebsocketProviderV2
+from web3._utils.request import async_make_post_request
+from web3.exceptions import ContractLogicError, TimeExhausted, TransactionNotFound
 
 logger = logging.getLogger(__name__)
 
+# Cluster contract ABI (minimal for our needs)
+CONTRACT_ABI = [
+    {
+        "inputs": [{"name": "instanceId", "type": "string"}],
+        "name": "registerInstance",
+        "outputs": [],
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {"name": "instanceId", "type": "string"},
+            {"name": "derivedPublicKey", "type": "bytes"},
+            {"name": "appPublicKey", "type": "bytes"},
+            {"name": "appSignature", "type": "bytes"},
+            {"name": "kmsSignature", "type": "bytes"},
+            {"name": "connectionUrl", "type": "string"},
+            {"name": "purpose", "type": "string"},
+            {"name": "appId", "type": "bytes32"}
+        ],
+        "name": "registerPeer",
+        "outputs": [],
+        "type": "function"
+    },
+    {
+        "inputs": [],
+        "name": "getPeerEndpoints",
+        "outputs": [{"name": "", "type": "string[]"}],
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {"name": "to", "type": "address"},
+            {"name": "", "type": "string"}
+        ],
+        "name": "mintNodeAccess",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function",
+        "stateMutability": "payable"
+    },
+    {
+        "inputs": [{"name": "", "type": "address"}],
+        "name": "walletToTokenId",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function",
+        "stateMutability": "view"
+    },
+    {
+        "inputs": [{"name": "", "type": "string"}],
+        "name": "instanceToToken",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function",
+        "stateMutability": "view"
+    },
+    {
+        "inputs": [],
+        "name": "owner",
+        "outputs": [{"name": "", "type": "address"}],
+        "type": "function",
+        "stateMutability": "view"
+    },
+    {
+        "inputs": [],
+        "name": "publicMinting",
+        "outputs": [{"name": "", "type": "bool"}],
+        "type": "function",
+        "stateMutability": "view"
+    },
+    {
+        "inputs": [],
+        "name": "mintPrice",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function",
+        "stateMutability": "view"
+    },
+    {
+        "inputs": [],
+        "name": "maxNodes",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function",
+        "stateMutability": "view"
+    },
+    {
+        "inputs": [
+            {"name": "_maxNodes", "type": "uint256"},
+            {"name": "_publicMinting", "type": "bool"},
+            {"name": "_mintPrice", "type": "uint256"}
+        ],
+        "name": "setClusterConfig",
+        "outputs": [],
+        "type": "function"
+    }
+]
+
+# Multicall3 is deployed at the same address on most EVM chains
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"}
+                ],
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"}
+                ],
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+# eth-account 0.13 renamed SignedTransaction.rawTransaction to raw_transaction
+_RAW_TX_ATTR = 'raw_transaction' if hasattr(SignedTransaction, 'raw_transaction') else 'rawTransaction'
+
+
+def _raw_tx(signed_tx: SignedTransaction) -> bytes:
+    """Serialized bytes of a signed transaction, whichever eth-account is installed."""
+    return getattr(signed_tx, _RAW_TX_ATTR)
+
+
+# 4-byte selectors for transactions whose calldata we encode ourselves
+REGISTER_INSTANCE_SELECTOR = keccak(text="registerInstance(string)")[:4]
+REGISTER_PEER_TYPES = ["string", "bytes", "bytes", "bytes", "bytes", "string", "string", "bytes32"]
+REGISTER_PEER_SELECTOR = keccak(text=f"registerPeer({','.join(REGISTER_PEER_TYPES)})")[:4]
+
+MINT_NODE_ACCESS_SELECTOR = keccak(text="mintNodeAccess(address,string)")[:4]
+
+# Views read with calldata encoded here instead of through web3's contract
+# function wrappers: name -> (selector, argument types, output type)
+RAW_VIEWS = {
+    "walletToTokenId": (keccak(text="walletToTokenId(address)")[:4], ["address"], "uint256"),
+}
+
+# Topics of the events that change the peer list
+PEER_REGISTERED_TOPIC = "0x" + keccak(text="PeerRegistered(string,string)").hex()
+INSTANCE_DEACTIVATED_TOPIC = "0x" + keccak(text="InstanceDeactivated(string)").hex()
+
+# ERC-721 Transfer(from, to, tokenId); a mint is a Transfer from the zero address
+TRANSFER_TOPIC = keccak(text="Transfer(address,address,uint256)")
+
+# Cluster configuration views read together by get_contract_config: name -> ABI output type
+CONFIG_VIEWS = {
+    "owner": "address",
+    "publicMinting": "bool",
+    "mintPrice": "uint256",
+    "maxNodes": "uint256",
+}
+
+async def _value(value):
+    """Awaitable that resolves to value, for optional entries in asyncio.gather"""
+    return value
+
+
+def _peer_set_digest(peers: List[str]) -> bytes:
+    """Order-independent 16-byte digest of a peer list, for cheap change detection"""
+    return hashlib.blake2b(b"".join(sorted({peer.encode() + b"\n" for peer in peers})), digest_size=16).digest()
+
+
+class BatchRequestRejected(ValueError):
+    """The node refused a JSON-RPC batch as a whole, so none of its requests ran"""
+
+
+async def single_flight(inflight: Dict[Any, asyncio.Future], key: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run fn() once for all concurrent callers using the same key.
+    Callers arriving while it runs await the same result (or exception); if the
+    caller running fn() is cancelled, the others are cancelled too rather than
+    left waiting. `inflight` is the caller's key -> pending future map.
+    """
+    pending = inflight.get(key)
+    if pending:
+        return await pending
+
+    future = asyncio.get_running_loop().create_future()
+    inflight[key] = future
+    try:
+        result = await fn()
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Mark retrieved so waiter-less futures don't log "never retrieved"
+        future.exception()
+        raise
+    finally:
+        del inflight[key]
+
+
+def run_async(main: Coroutine[Any, Any, Any]) -> Any:
+    """asyncio.run, on uvloop when it is installed (it ships with uvicorn[standard])"""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(main)
+    return uvloop.run(main)
+
+
+# Process-wide Web3 and Contract objects, one per RPC endpoint (and contract address)
+_W3_CACHE: Dict[str, AsyncWeb3] = {}
+_CONTRACT_CACHE: Dict[Tuple[str, str], Any] = {}
+# /metrics counters per RPC endpoint: (metric name, ((label, value), ...)) -> count
+_METRICS: Dict[str, Counter] = {}
+
+
+def _rpc_counter_middleware(metrics: Counter):
+    """Web3 middleware counting every JSON-RPC request sent through the provider"""
+    async def middleware(make_request, w3):
+        async def count_request(method, params):
+            metrics[("rpc_calls_total", (("method", str(method)),))] += 1
+            return await make_request(method, params)
+        return count_request
+    return middleware
+
+
+def _shared_web3(rpc_url: str) -> AsyncWeb3:
+    """AsyncWeb3 for rpc_url, created on first use and shared afterwards"""
+    w3 = _W3_CACHE.get(rpc_url)
+    if w3 is None:
+        w3 = _W3_CACHE[rpc_url] = AsyncWeb3(AsyncHTTPProvider(rpc_url))
+        metrics = _METRICS.setdefault(rpc_url, Counter())
+        w3.middleware_onion.add(_rpc_counter_middleware(metrics), name="rpc_counter")
+    return w3
+
+
+def _shared_contract(rpc_url: str, contract_address: str):
+    """Cluster Contract bound to the shared AsyncWeb3 for rpc_url"""
+    key = (rpc_url, contract_address)
+    contract = _CONTRACT_CACHE.get(key)
+    if contract is None:
+        contract = _CONTRACT_CACHE[key] = _shared_web3(rpc_url).eth.contract(
+            address=contract_address,
+            abi=CONTRACT_ABI
+        )
+    return contract
+
+
 class DStackP2PSDK:
     def __init__(self, contract_address: str, connection_url: str,
-                 rpc_url: str = "http://localhost:8545", dstack_socket: str = "./simulator/dstack.sock"):
+                 rpc_url: str = "http://localhost:8545", dstack_socket: str = "./simulator/dstack.sock",
+                 ws_url: Optional[str] = None, private_key: Optional[str] = None):
         """
         Ultra-simple P2P SDK interface.
         
@@ -31,112 +299,174 @@ class DStackP2PSDK:
                            - Dev: any URL (http://localhost:8080, 10.0.1.1:5432, etc)
             rpc_url: Blockchain RPC endpoint
             dstack_socket: Path to dstack socket (for simulator)
+            ws_url: Optional websocket RPC endpoint; monitor_peers subscribes to
+                    contract events over it instead of polling
+            private_key: Key that signs transactions (default: PRIVATE_KEY env var)
         """
             
         self.contract_address = contract_address
         self.connection_url = connection_url
         self.rpc_url = rpc_url
+        self.ws_url = ws_url
+        self._private_key = private_key
         self.dstack_socket = dstack_socket
         
-        # Initialize Web3
-        self.w3 = Web3(Web3.HTTPProvider(rpc_url))
+        # Initialize Web3 (shared by every SDK instance using this RPC endpoint)
+        self.w3 = _shared_web3(rpc_url)
         
         # Initialize DStack client
         self.dstack = DstackClient(dstack_socket)
         
-        # Contract ABI (minimal for our needs)
-        self.contract_abi = [
-            {
-                "inputs": [{"name": "instanceId", "type": "string"}],
-                "name": "registerInstance",
-                "outputs": [],
-                "type": "function"
-            },
-            {
-                "inputs": [
-                    {"name": "instanceId", "type": "string"},
-                    {"name": "derivedPublicKey", "type": "bytes"},
-                    {"name": "appPublicKey", "type": "bytes"},
-                    {"name": "appSignature", "type": "bytes"},
-                    {"name": "kmsSignature", "type": "bytes"},
-                    {"name": "connectionUrl", "type": "string"},
-                    {"name": "purpose", "type": "string"},
-                    {"name": "appId", "type": "bytes32"}
-                ],
-                "name": "registerPeer",
-                "outputs": [],
-                "type": "function"
-            },
-            {
-                "inputs": [],
-                "name": "getPeerEndpoints",
-                "outputs": [{"name": "", "type": "string[]"}],
-                "type": "function"
-            },
-            {
-                "inputs": [
-                    {"name": "to", "type": "address"},
-                    {"name": "", "type": "string"}
-                ],
-                "name": "mintNodeAccess",
-                "outputs": [{"name": "", "type": "uint256"}],
-                "type": "function",
-                "stateMutability": "payable"
-            },
-            {
-                "inputs": [{"name": "", "type": "address"}],
-                "name": "walletToTokenId",
-                "outputs": [{"name": "", "type": "uint256"}],
-                "type": "function",
-                "stateMutability": "view"
-            },
-            {
-                "inputs": [],
-                "name": "owner",
-                "outputs": [{"name": "", "type": "address"}],
-                "type": "function",
-                "stateMutability": "view"
-            },
-            {
-                "inputs": [],
-                "name": "publicMinting",
-                "outputs": [{"name": "", "type": "bool"}],
-                "type": "function",
-                "stateMutability": "view"
-            },
-            {
-                "inputs": [],
-                "name": "mintPrice",
-                "outputs": [{"name": "", "type": "uint256"}],
-                "type": "function",
-                "stateMutability": "view"
-            },
-            {
-                "inputs": [],
-                "name": "maxNodes",
-                "outputs": [{"name": "", "type": "uint256"}],
-                "type": "function",
-                "stateMutability": "view"
-            },
-            {
-                "inputs": [
-                    {"name": "_maxNodes", "type": "uint256"},
-                    {"name": "_publicMinting", "type": "bool"},
-                    {"name": "_mintPrice", "type": "uint256"}
-                ],
-                "name": "setClusterConfig",
-                "outputs": [],
-                "type": "function"
-            }
-        ]
+        # Contract ABI (minimal for our needs); shared by all instances
+        self.contract_abi = CONTRACT_ABI
         
-        self.contract = self.w3.eth.contract(
-            address=contract_address,
-            abi=self.contract_abi
-        )
+        self.contract = _shared_contract(rpc_url, contract_address)
         
         self.instance_id = None
         self.registered = False
+        self.instance_registered = False
+        self._app_id_bytes32: Optional[bytes] = None
+        self._multicall = None  # Multicall3 contract, bound on first use
+        # ((instance_id, connection_url), registerPeer calldata) from the last attempt
+        self._register_peer_calldata: Optional[Tuple[Tuple[Optional[str], str], bytes]] = None
+        self._dstack_info = None
+        self._proof_generator: Optional[SignatureProofGenerator] = None
+        self._account: Optional[LocalAccount] = None
+        self._local_nonce: Optional[int] = None
+        self._tx_lock = asyncio.Lock()
+        self._tx_template: Optional[Dict[str, Any]] = None  # from/gas/chainId shared by every tx
+        self._fee_cache: Tuple[float, Dict[str, int]] = (0.0, {})  # (expires_at, fee fields)
+
+        # Read-only contract call cache: (fn_name, args) -> (expires_at, value)
+        self._call_cache: Dict[Tuple, Tuple[float, Any]] = {}
+        self._inflight_calls: Dict[Tuple, asyncio.Future] = {}
+
+        # Counters for /metrics, shared with the provider middleware for this endpoint
+        self.metrics: Counter = _METRICS[rpc_url]
+
+    def _count(self, name: str, value: int = 1, **labels):
+        """Add to a metrics counter"""
+        self.metrics[(name, tuple(sorted(labels.items())))] += value
+
+    async def _rpc(self, fn, *args):
+        """Run a blocking call (dstack socket, signing) in a worker thread so the event loop stays free."""
+        return await asyncio.to_thread(fn, *args)
+
+    async def _cached_call(self, fn_name: str, *args, ttl: float = 2.0):
+        """
+        Call a view function on the contract, serving repeat reads from memory.
+
+        Results are kept for `ttl` seconds, and concurrent callers asking for the
+        same (fn_name, args) while a request is in flight share that request.
+        """
+        key = (fn_name, args)
+        cached = self._call_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._count("view_cache_hits_total", function=fn_name)
+            return cached[1]
+
+        if key in self._inflight_calls:
+            self._count("view_calls_coalesced_total", function=fn_name)
+
+        async def fetch():
+            view = RAW_VIEWS.get(fn_name)
+            if view is not None:
+                selector, arg_types, out_type = view
+                data = await self.w3.eth.call({
+                    'to': self.contract.address,
+                    'data': selector + abi_encode(arg_types, list(args)),
+                })
+                value = abi_decode([out_type], data)[0]
+            else:
+                value = await getattr(self.contract.functions, fn_name)(*args).call()
+            self._call_cache[key] = (time.monotonic() + ttl, value)
+            return value
+
+        return await single_flight(self._inflight_calls, key, fetch)
+
+    def invalidate_call(self, fn_name: str, *args):
+        """Drop a cached view-call result so the next read hits the chain."""
+        self._call_cache.pop((fn_name, args), None)
+
+    async def multicall(self, calls: List[Tuple], allow_failure: bool = False) -> List[Any]:
+        """
+        Read several view functions of the cluster contract in one eth_call (Multicall3 aggregate3).
+        Args:
+            calls: (function name, ABI output type[, args tuple]) entries
+            allow_failure: Return None for calls that revert instead of failing the whole batch
+        Returns: Decoded values, in the same order as calls
+        """
+        if self._multicall is None:
+            self._multicall = self.w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+        batch = [
+            (
+                self.contract.address,
+                allow_failure,
+                self.contract.encodeABI(fn_name=call[0], args=call[2] if len(call) > 2 else None),
+            )
+            for call in calls
+        ]
+        results = await self._multicall.functions.aggregate3(batch).call()
+        self._count("multicall_saved_rpcs_total", len(calls) - 1)
+        return [
+            abi_decode([call[1]], data)[0] if success else None
+            for call, (success, data) in zip(calls, results)
+        ]
+
+    async def get_contract_config(self) -> Dict[str, Any]:
+        """
+        Get the cluster configuration (owner, minting settings, node limit).
+        Uses a single Multicall3 round trip, falling back to parallel calls on
+        chains where Multicall3 isn't deployed (e.g. a fresh local devnet).
+        """
+        names = list(CONFIG_VIEWS)
+        try:
+            values = await self.multicall(list(CONFIG_VIEWS.items()))
+        except Exception as e:
+            logger.debug("Multicall3 unavailable, reading config views individually: %s", e)
+            values = await asyncio.gather(*(self._cached_call(name, ttl=30.0) for name in names))
+        return dict(zip(names, values))
+
+    @property
+    def account(self) -> LocalAccount:
+        """Transaction signing account, decoded from private_key/PRIVATE_KEY once on first use."""
+        if self._account is None:
+            self._account = Account.from_key(self._private_key or os.environ["PRIVATE_KEY"])  # Required
+        return self._account
+
+    async def _fee_fields(self, ttl: float = 5.0, history: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+        """
+        Fee fields for the next transaction, refreshed at most every `ttl` seconds.
+        EIP-1559 (type 2) fees from a single eth_feeHistory call: the pending
+        block's base fee plus the median tip paid over the last 5 blocks, or a
+        legacy gasPrice on chains without a base fee.
+        Pass `history` when eth_feeHistory(5, latest, [50]) was already fetched.
+        """
+        expires_at, fees = self._fee_cache
+        if expires_at <= time.monotonic():
+            if history is None:
+                history = await self.w3.eth.fee_history(5, 'latest', [50])
+            base_fee = history['baseFeePerGas'][-1]  # Base fee of the next block
+            if not base_fee:
+                fees = {'gasPrice': await self.w3.eth.gas_price}
+            else:
+                tips = sorted(reward[0] for reward in history.get('reward') or [[0]])
+                # No fixed floor: L2 tips (e.g. ~0.001 gwei on Base) are far below
+                # L1 norms, and the median already tracks what gets included
+                priority_fee = tips[len(tips) // 2]
+                fees = {
+                    'type': 2,
+                    'maxPriorityFeePerGas': priority_fee,
+                    'maxFeePerGas': 2 * base_fee + priority_fee,
+                }
+            self._fee_cache = (time.monotonic() + ttl, fees)
+        return fees
+
+    async def get_dstack_info(self):
+        """DStack instance info, fetched from the agent once and then reused."""
+        if self._dstack_info is None:
+            self._dstack_info = await self._rpc(self.dstack.info)
+        return self._dstack_info
 
     async def register(self) -> bool:
         """
@@ -145,35 +475,216 @@ class DStackP2PSDK:
         Returns: Success boolean
         """
         try:
-            await self.register_instance()
-            await self.register_peer()
+            # Steps that already succeeded in this process are not re-sent
+            instance_call = None
+            if not self.instance_registered:
+                instance_call = await self._register_instance_call()
+                if instance_call is None:
+                    return False
+            
+            # The on-chain instance check and the dstack proof for registerPeer don't
+            # depend on each other (both reuse the dstack info fetched above)
+            on_chain, peer_call = await asyncio.gather(
+                self._instance_on_chain() if instance_call is not None else _value(True),
+                self._register_peer_call() if not self.registered else _value(None),
+            )
+            
+            steps = []
+            if instance_call is not None:
+                if on_chain:
+                    self.instance_registered = True
+                else:
+                    steps.append((instance_call, "registerInstance"))
+            if peer_call is not None:
+                steps.append((peer_call, "registerPeer"))
+            
+            # Submit in one batch request with consecutive nonces and wait for both
+            # receipts together; registerPeer is mined after registerInstance, so the
+            # instance is already active when it executes
+            tx_hashes = await self.submit_transactions([call for call, _ in steps])
+            await asyncio.gather(*(
+                self.wait_for_receipt(tx_hash, description)
+                for tx_hash, (_, description) in zip(tx_hashes, steps)
+            ))
+            self.instance_registered = self.registered = True
             return True
         except Exception as e:
             logger.error(f"Registration failed: {e}")
             return False
 
     # Helper function to send transaction
-    def send_transaction(self, contract_function, description):
+    async def send_transaction(self, contract_function, description):
+        """
+        Sign and send a transaction to the cluster contract, then wait for its receipt.
+        Args:
+            contract_function: Bound contract function, or pre-encoded calldata bytes
+            description: Label used in log messages
+        """
+        tx_hash = await self.submit_transaction(contract_function, description)
+        return await self.wait_for_receipt(tx_hash, description)
+
+    async def submit_transaction(self, contract_function, description):
+        """
+        Sign and send a transaction to the cluster contract without waiting for it to be mined.
+        Returns: Transaction hash
+        """
+        tx_hashes = await self.submit_transactions([contract_function])
+        return tx_hashes[0]
+
+    async def submit_transactions(self, contract_functions: List[Any]) -> List[HexBytes]:
+        """
+        Sign transactions with consecutive nonces and send them without waiting for them to be mined.
+        More than one transaction goes out as a single JSON-RPC batch request.
+        Returns: Transaction hashes, in order
+        """
+        if not contract_functions:
+            return []
+
         # Get transaction account from private key
-        import os
-        private_key = os.environ["PRIVATE_KEY"]  # Required
-        
-        from eth_account import Account
-        account = Account.from_key(private_key)
+        account = self.account
         tx_account = account.address
-        logger.info(f"Using private key account {tx_account} for transaction")
-
-        # Build and sign transaction with private key
-        tx = contract_function.build_transaction({
-            'from': tx_account,
-            'nonce': self.w3.eth.get_transaction_count(tx_account),
-            'gas': 2000000,
-            'gasPrice': self.w3.eth.gas_price,
-        })
-        signed_tx = account.sign_transaction(tx)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        
-        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        logger.info("Using private key account %s for transaction", tx_account)
+
+        # Nonce allocation through submission is serialized so concurrent callers
+        # (e.g. overlapping /register and /mint-nft requests) never reuse a nonce
+        async with self._tx_lock:
+            # The nonce is tracked locally after the first transaction; only the
+            # first send (or a resync after a failure) asks the node for it, in the
+            # same round-trip as the other lookups it needs
+            if self._local_nonce is None:
+                self._local_nonce, fees, chain_id = await self._sender_state(tx_account)
+                # Fields that never change between our transactions; with chainId set
+                # build_transaction doesn't ask the node for it every time
+                if self._tx_template is None:
+                    self._tx_template = {
+                        'from': tx_account,
+                        'gas': 2000000,
+                        'chainId': chain_id,
+                    }
+            else:
+                fees = await self._fee_fields()
+
+            # Build and sign transactions with private key
+            raw_txs = []
+            for offset, contract_function in enumerate(contract_functions):
+                tx_params = {
+                    **self._tx_template,
+                    'nonce': self._local_nonce + offset,
+                    **fees,
+                }
+                if isinstance(contract_function, bytes):
+                    tx = {**tx_params, 'to': self.contract.address, 'data': contract_function, 'value': 0}
+                else:
+                    tx = await contract_function.build_transaction(tx_params)
+                signed_tx = await self._rpc(account.sign_transaction, tx)
+                raw_txs.append(_raw_tx(signed_tx))
+            try:
+                if len(raw_txs) == 1:
+                    tx_hashes = [await self.w3.eth.send_raw_transaction(raw_txs[0])]
+                else:
+                    tx_hashes = await self._send_raw_batch(raw_txs)
+            except Exception:
+                # Nonce may be stale (e.g. another sender used this key) - resync next time
+                self._local_nonce = None
+                raise
+            self._local_nonce += len(raw_txs)
+        return tx_hashes
+
+    async def _batch_request(self, requests: List[Tuple[str, list]]) -> List[Any]:
+        """
+        Send several JSON-RPC requests in one HTTP POST.
+        Args:
+            requests: (method, params) pairs
+        Returns: Raw (unformatted) results, in the same order as requests
+        """
+        payload = json.dumps([
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params) in enumerate(requests)
+        ])
+        # Goes through web3's cached aiohttp session for this endpoint
+        try:
+            body = await async_make_post_request(
+                self.rpc_url, payload, **self.w3.provider.get_request_kwargs()
+            )
+        except aiohttp.ClientResponseError as e:
+            # HTTP error status: the endpoint didn't accept the batch
+            raise BatchRequestRejected(f"Batch request failed: HTTP {e.status}") from e
+        # Batches bypass the provider middleware, so count their calls here
+        for method, _ in requests:
+            self._count("rpc_calls_total", method=method)
+        self._count("batch_saved_rpcs_total", len(requests) - 1)
+        replies = json.loads(body)
+        if isinstance(replies, dict):
+            # Node rejected the batch as a whole (e.g. batching disabled)
+            raise BatchRequestRejected(f"Batch request failed: {replies.get('error')}")
+        by_id = {reply.get("id"): reply for reply in replies}
+        results = []
+        for i, (method, _) in enumerate(requests):
+            reply = by_id.get(i)
+            if reply is None or "error" in reply:
+                error = reply.get("error") if reply else "no response"
+                raise ValueError(f"{method} failed for request {i}: {error}")
+            results.append(reply["result"])
+        return results
+
+    async def _send_raw_batch(self, raw_txs: List[bytes]) -> List[HexBytes]:
+        """
+        Send signed transactions as one JSON-RPC batch (eth_sendRawTransaction each),
+        or one at a time in nonce order on nodes that don't accept batches.
+        """
+        try:
+            results = await self._batch_request([
+                ("eth_sendRawTransaction", ["0x" + raw.hex()]) for raw in raw_txs
+            ])
+        except BatchRequestRejected as e:
+            logger.debug("Batch request unavailable, sending transactions individually: %s", e)
+            return [await self.w3.eth.send_raw_transaction(raw) for raw in raw_txs]
+        return [HexBytes(tx_hash) for tx_hash in results]
+
+    async def _sender_state(self, address: str) -> Tuple[int, Dict[str, int], int]:
+        """
+        Pending nonce, fee fields and chain ID for address, fetched in one batch request
+        (or concurrently, on nodes that don't accept batches).
+        """
+        try:
+            nonce, history, chain_id = await self._batch_request([
+                ("eth_getTransactionCount", [address, "pending"]),
+                ("eth_feeHistory", [hex(5), "latest", [50]]),
+                ("eth_chainId", []),
+            ])
+        except Exception as e:
+            logger.debug("Batch request unavailable, fetching sender state individually: %s", e)
+            return await asyncio.gather(
+                self.w3.eth.get_transaction_count(address, 'pending'),
+                self._fee_fields(),
+                self.w3.eth.chain_id,
+            )
+        history = {
+            'baseFeePerGas': [int(fee, 16) for fee in history['baseFeePerGas']],
+            'reward': [[int(tip, 16) for tip in row] for row in history.get('reward') or []],
+        }
+        return int(nonce, 16), await self._fee_fields(history=history), int(chain_id, 16)
+
+    async def wait_for_receipt(self, tx_hash, description, timeout: float = 120.0):
+        """Wait for a submitted transaction to be mined and return its receipt (raises if it reverted)."""
+        # Poll with exponential backoff (0.25s growing to 7s) instead of web3's
+        # fixed 0.1s interval, so a slow block costs a handful of requests
+        deadline = time.monotonic() + timeout
+        delay = 0.25
+        while True:
+            try:
+                receipt = await self.w3.eth.get_transaction_receipt(tx_hash)
+                break
+            except TransactionNotFound:
+                if time.monotonic() >= deadline:
+                    raise TimeExhausted(
+                        f"Transaction {HexBytes(tx_hash).hex()} is not in the chain after {timeout} seconds"
+                    )
+                await asyncio.sleep(delay)
+                delay = min(7.0, delay * 1.5)
+        # A mined but reverted transaction must not count as success
+        if receipt['status'] != 1:
+            raise ContractLogicError(f"{description} transaction reverted: {receipt.transactionHash.hex()}")
         logger.info(f"{description} transaction successful: {receipt.transactionHash.hex()}")
         return receipt
 
@@ -184,24 +695,41 @@ class DStackP2PSDK:
         Returns: Success boolean
         """
         try:
-            # Get instance info from DStack
-            info = self.dstack.info()
-            self.instance_id = info.instance_id
-            
-            if not self.instance_id:
-                logger.error("Could not get instance ID from dstack")
+            instance_call = await self._register_instance_call()
+            if instance_call is None:
                 return False
-
-            logger.info(f"Registering instance {self.instance_id}")
-            self.send_transaction(
-                self.contract.functions.registerInstance(self.instance_id),
-                "registerInstance"
-            )
+            if not await self._instance_on_chain():
+                await self.send_transaction(instance_call, "registerInstance")
+            self.instance_registered = True
         except Exception as e:
             logger.warning(f"registerInstance failed (may already be registered): {e}")
             return False
         return True
 
+    async def _register_instance_call(self) -> Optional[bytes]:
+        """Look up this instance's ID and encode the registerInstance calldata (None if no ID)."""
+        # Get instance info from DStack
+        info = await self.get_dstack_info()
+        self.instance_id = info.instance_id
+        
+        if not self.instance_id:
+            logger.error("Could not get instance ID from dstack")
+            return None
+
+        logger.info("Registering instance %s", self.instance_id)
+        return REGISTER_INSTANCE_SELECTOR + abi_encode(['string'], [self.instance_id])
+
+    async def _instance_on_chain(self) -> bool:
+        """Whether registerInstance already went through for this instance ID (one eth_call)."""
+        try:
+            token_id = await self.contract.functions.instanceToToken(self.instance_id).call()
+        except Exception as e:
+            # Can't tell - send registerInstance and let the contract decide
+            logger.debug("instanceToToken lookup failed: %s", e)
+            return False
+        if token_id:
+            logger.info("Instance %s already registered with token %s", self.instance_id, token_id)
+        return bool(token_id)
         
     async def register_peer(self) -> bool:
         """
@@ -211,57 +739,11 @@ class DStackP2PSDK:
         Returns: Success boolean
         """
         try:
-            logger.info(f"Registering instance {self.instance_id} with URL: {self.connection_url}")
-            
-            # Generate signature proof for peer registration
-            sig_gen = SignatureProofGenerator(self.dstack_socket)
-            
-            # Create signature proof using correct API  
-            proof = sig_gen.generate_proof("wallet/ethereum", "ethereum")
-            
-            app_signature = proof.app_signature
-            kms_signature = proof.kms_signature
-            app_id = proof.app_id
-            
-            # Get app public key from signature verification
-            from eth_keys import keys
-            from eth_utils import keccak
-            
-            derived_pubkey_sec1 = keys.PrivateKey(proof.derived_private_key).public_key.to_compressed_bytes()
-            app_message = f"ethereum:{derived_pubkey_sec1.hex()}"
-            app_message_hash = keccak(bytes(app_message, 'utf-8'))  # Use raw keccak256 like the contract
-            app_signature_obj = keys.Signature(app_signature)
-            app_pubkey_sec1 = app_signature_obj.recover_public_key_from_msg_hash(app_message_hash).to_compressed_bytes()
-            
-            
-            # Convert app_id to bytes32
-            app_id_bytes32 = bytes.fromhex(app_id.replace('0x', '')).ljust(32, b'\x00')[:32]
-            
-            # Actually call registerPeer on contract
-            logger.info(f"Calling registerPeer with connection URL: {self.connection_url}")
-            logger.info(f"Instance ID: {self.instance_id}")
-            logger.info(f"Derived public key: {derived_pubkey_sec1.hex()}")
-            logger.info(f"App public key: {app_pubkey_sec1.hex()}")
-            logger.info(f"App signature: {app_signature.hex()}")
-            logger.info(f"KMS signature: {kms_signature.hex()}")
-            logger.info(f"App ID: {app_id}")
-            logger.info(f"App ID bytes32: {app_id_bytes32.hex()}")
+            peer_call = await self._register_peer_call()
             
             # Call registerPeer function
             try:
-                self.send_transaction(
-                    self.contract.functions.registerPeer(
-                        self.instance_id,
-                        derived_pubkey_sec1,  # derived public key (SEC1 compressed)
-                        app_pubkey_sec1,      # app public key (SEC1 compressed)
-                        app_signature,
-                        kms_signature,
-                        self.connection_url,
-                        "ethereum",           # purpose
-                        app_id_bytes32        # app ID as bytes32
-                    ),
-                    "registerPeer"
-                )
+                await self.send_transaction(peer_call, "registerPeer")
                 
                 self.registered = True
                 return True
@@ -273,7 +755,80 @@ class DStackP2PSDK:
         except Exception as e:
             logger.error(f"Registration failed: {e}")
             return False
+
+    async def _register_peer_call(self) -> bytes:
+        """Generate the dstack signature proof and encode the registerPeer calldata."""
+        logger.info("Registering instance %s with URL: %s", self.instance_id, self.connection_url)
+        
+        # A retry for the same instance and URL reuses the calldata as-is: the proof
+        # and its encoding come out identical, so neither is redone
+        call_key = (self.instance_id, self.connection_url)
+        if self._register_peer_calldata is not None and self._register_peer_calldata[0] == call_key:
+            return self._register_peer_calldata[1]
+        
+        # Generate signature proof for peer registration
+        if self._proof_generator is None:
+            self._proof_generator = SignatureProofGenerator(self.dstack_socket, client=self.dstack)
+        
+        # Create signature proof using correct API, reusing the already-fetched instance info
+        info = await self.get_dstack_info()
+        proof = await self._rpc(self._proof_generator.generate_proof, "wallet/ethereum", "ethereum", info)
+        
+        app_signature = proof.app_signature
+        kms_signature = proof.kms_signature
+        app_id = proof.app_id
+        
+        # Compressed public keys, computed once by the proof generator
+        derived_pubkey_sec1 = proof.derived_public_key
+        app_pubkey_sec1 = proof.app_public_key
+        
+        # Convert app_id to bytes32 (app_id is fixed for this app, so convert once).
+        # The 20-byte app ID must stay left-aligned: the contract reads it back with
+        # bytes20(appId), which keeps the leading bytes, so right-padding is required
+        if self._app_id_bytes32 is None:
+            self._app_id_bytes32 = HexBytes(app_id)[:32].ljust(32, b'\x00')
+        app_id_bytes32 = self._app_id_bytes32
+        
+        # Actually call registerPeer on contract
+        logger.info("Calling registerPeer with connection URL: %s", self.connection_url)
+        logger.info("Instance ID: %s", self.instance_id)
+        logger.info("App ID: %s", app_id)
+        # Key/signature dumps are only hex-encoded when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Derived public key: %s", derived_pubkey_sec1.hex())
+            logger.debug("App public key: %s", app_pubkey_sec1.hex())
+            logger.debug("App signature: %s", app_signature.hex())
+            logger.debug("KMS signature: %s", kms_signature.hex())
+            logger.debug("App ID bytes32: %s", app_id_bytes32.hex())
+        
+        calldata = REGISTER_PEER_SELECTOR + abi_encode(REGISTER_PEER_TYPES, [
+            self.instance_id,
+            derived_pubkey_sec1,  # derived public key (SEC1 compressed)
+            app_pubkey_sec1,      # app public key (SEC1 compressed)
+            app_signature,
+            kms_signature,
+            self.connection_url,
+            "ethereum",           # purpose
+            app_id_bytes32        # app ID as bytes32
+        ])
+        self._register_peer_calldata = (call_key, calldata)
+        return calldata
     
+    def mint_node_access_call(self, to: str, instance_id: str) -> bytes:
+        """Encode mintNodeAccess(to, instance_id) calldata for submit_transaction/send_transaction."""
+        return MINT_NODE_ACCESS_SELECTOR + abi_encode(['address', 'string'], [to, instance_id])
+
+    def minted_token_id(self, receipt) -> Optional[int]:
+        """Token ID minted by the cluster contract in a transaction receipt (None if nothing was minted)."""
+        contract_address = self.contract.address.lower()
+        for log in receipt['logs']:
+            topics = log['topics']
+            if (len(topics) == 4 and bytes(topics[0]) == TRANSFER_TOPIC
+                    and log['address'].lower() == contract_address
+                    and not int.from_bytes(bytes(topics[1]), 'big')):
+                return int.from_bytes(bytes(topics[3]), 'big')
+        return None
+
     async def get_peers(self) -> List[str]:
         """
         Get current list of active peer endpoints.
@@ -281,41 +836,199 @@ class DStackP2PSDK:
         """
         try:
             # Query contract for peer endpoints
-            endpoints = self.contract.functions.getPeerEndpoints().call()
+            endpoints = await self._cached_call("getPeerEndpoints")
             
-            logger.info(f"Retrieved {len(endpoints)} peer endpoints")
+            logger.debug("Retrieved %d peer endpoints", len(endpoints))
             return endpoints
             
         except Exception as e:
-            logger.error(f"Failed to get peers: {e}")
+            logger.error("Failed to get peers: %s", e)
             return []
     
-    async def monitor_peers(self, callback):
+    async def get_token_id(self, wallet_address: str) -> int:
+        """
+        Get the membership NFT token ID held by a wallet (0 if none).
+        Ownership only changes when we mint, so the result is cached for 30s;
+        callers that just minted should invalidate_call("walletToTokenId", addr).
+        """
+        return await self._cached_call("walletToTokenId", wallet_address, ttl=30.0)
+    
+    async def monitor_peers(self, callback, heartbeat: float = 60.0, max_interval: float = 10.0):
         """
         Subscribe to peer list changes.
         Args:
             callback: Function called with new peer list when changes occur
+            heartbeat: Re-read the full peer list at least this often (seconds)
+            max_interval: Longest wait between polls once the cluster is quiet (seconds);
+                          bounds how late a joining peer is noticed
         """
-        # Simple polling implementation for now
-        last_peers = []
+        if self.ws_url:
+            await self._monitor_peers_ws(callback)
+            return
+        
+        # Poll a log filter for PeerRegistered/InstanceDeactivated events and only
+        # re-read getPeerEndpoints when one arrives (or on the heartbeat)
+        last_digest = _peer_set_digest([])
+        peer_filter = None
+        # Cleared if the RPC can't install log filters (eth_newFilter is often
+        # unavailable behind load balancers); then getPeerEndpoints is simply
+        # re-read every max_interval seconds
+        use_filter = True
+        last_refresh = 0.0
+        # Polls since the last change; the interval grows while nothing happens
+        # and drops back to 1s as soon as something does
+        consecutive_unchanged = 0
         
         while True:
             try:
-                current_peers = await self.get_peers()
+                changed = True
+                if use_filter and peer_filter is None:
+                    try:
+                        peer_filter = await self.w3.eth.filter({
+                            'address': self.contract.address,
+                            'topics': [[PEER_REGISTERED_TOPIC, INSTANCE_DEACTIVATED_TOPIC]],
+                        })
+                    except Exception as e:
+                        logger.warning("Log filter unavailable (%s); polling peers every %ss", e, max_interval)
+                        use_filter = False
+                elif use_filter:
+                    changed = bool(await peer_filter.get_new_entries())
                 
-                if current_peers != last_peers:
-                    logger.info(f"Peer list changed: {current_peers}")
-                    await callback(current_peers)
-                    last_peers = current_peers
+                if changed or time.monotonic() - last_refresh >= heartbeat:
+                    if changed:
+                        self.invalidate_call("getPeerEndpoints")
+                    current_peers = await self.get_peers()
+                    last_refresh = time.monotonic()
                     
-                await asyncio.sleep(10)  # Poll every 10 seconds
+                    digest = _peer_set_digest(current_peers)
+                    if digest != last_digest:
+                        logger.info("Peer list changed: %s", current_peers)
+                        await callback(current_peers)
+                        last_digest = digest
+                        consecutive_unchanged = 0
+                    else:
+                        consecutive_unchanged += 1
+                else:
+                    consecutive_unchanged += 1
+                    
+                if use_filter:
+                    await asyncio.sleep(min(max_interval, max(1.0, 2.0 * consecutive_unchanged)))
+                else:
+                    await asyncio.sleep(max_interval)
                 
             except Exception as e:
-                logger.error(f"Monitor peers error: {e}")
+                logger.error("Monitor peers error: %s", e)
+                # The node may have expired our filter; install a fresh one next round
+                peer_filter = None
                 await asyncio.sleep(10)
 
+    async def _refresh_peers(self, callback, last_digest: bytes) -> bytes:
+        """Re-read the peer list and invoke callback if its digest differs from last_digest"""
+        self.invalidate_call("getPeerEndpoints")
+        current_peers = await self.get_peers()
+        digest = _peer_set_digest(current_peers)
+        if digest != last_digest:
+            logger.info("Peer list changed: %s", current_peers)
+            await callback(current_peers)
+        return digest
+
+    async def _monitor_peers_ws(self, callback):
+        """monitor_peers over an eth_subscribe("logs") websocket subscription"""
+        last_digest = _peer_set_digest([])
+        
+        while True:
+            try:
+                async with AsyncWeb3.persistent_websocket(WebsocketProviderV2(self.ws_url)) as ws_w3:
+                    await ws_w3.eth.subscribe('logs', {
+                        'address': self.contract.address,
+                        'topics': [[PEER_REGISTERED_TOPIC, INSTANCE_DEACTIVATED_TOPIC]],
+                    })
+                    
+                    # Read once on (re)connect - events may have been missed meanwhile -
+                    # then again only when the contract reports a change
+                    last_digest = await self._refresh_peers(callback, last_digest)
+                    async for _ in ws_w3.ws.listen_to_websocket():
+                        last_digest = await self._refresh_peers(callback, last_digest)
+                        
+            except Exception as e:
+                logger.error("Peer subscription error: %s", e)
+                await asyncio.sleep(5)
+
+# Candidate DStack socket paths, in order of preference
+DSTACK_SOCKET_PATHS = [
+    "/var/run/dstack.sock",          # Phala Cloud production
+    "./simulator/dstack.sock",       # Local development
+    "/app/simulator/dstack.sock",    # Docker container
+    "/tmp/dstack.sock"               # Alternative location
+]
+DEFAULT_DSTACK_SOCKET = "/var/run/dstack.sock"
+
+_discovered_dstack_socket: Optional[str] = None
+
+def discover_dstack_socket() -> str:
+    """
+    Find the DStack agent socket for this environment.
+    An explicit DSTACK_SOCKET environment variable wins without touching the
+    filesystem. Otherwise the first existing path in DSTACK_SOCKET_PATHS is
+    remembered for the rest of the process; if none exists yet the production
+    default is returned (and the search is retried on the next call).
+    """
+    global _discovered_dstack_socket
+    if _discovered_dstack_socket:
+        return _discovered_dstack_socket
+    
+    configured = os.environ.get("DSTACK_SOCKET")
+    if configured:
+        _discovered_dstack_socket = configured
+        return configured
+    
+    for path in DSTACK_SOCKET_PATHS:
+        if os.path.exists(path):
+            logger.info(f"Found DStack socket at: {path}")
+            _discovered_dstack_socket = path
+            return path
+    
+    logger.warning("No DStack socket found. Tried paths:")
+    for path in DSTACK_SOCKET_PATHS:
+        logger.warning(f"  - {path} (not found)")
+    return DEFAULT_DSTACK_SOCKET
+
+async def _connect_unix(socket_path: str):
+    """Open and close one connection to a Unix socket; raises OSError if nothing is listening"""
+    _, writer = await asyncio.open_unix_connection(socket_path)
+    writer.close()
+    await writer.wait_closed()
+
+async def wait_for_dstack_agent(probe: Callable[[], Awaitable[Any]], timeout: float = 60.0,
+                                socket_path: Optional[str] = None) -> int:
+    """
+    Wait until the DStack agent answers requests.
+    Retries the `probe` coroutine function with exponential backoff (50ms up to
+    500ms) until it succeeds or `timeout` seconds have passed. With `socket_path`,
+    each attempt first checks that the socket accepts connections, so the
+    cheap check and the real probe share one loop and one deadline.
+    Returns: Number of attempts it took; re-raises the last error on timeout
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            if socket_path is not None:
+                await _connect_unix(socket_path)
+            await probe()
+            return attempt
+        except Exception:
+            if time.monotonic() + delay > deadline:
+                raise
+            logger.info(f"DStack agent not ready (attempt {attempt}), retrying in {delay:.2f}s...")
+            await asyncio.sleep(delay)
+            # Capped low: an attempt is one local connect (plus info() once that
+            # succeeds), and the cap bounds how late a ready agent is noticed
+            delay = min(delay * 1.5, 0.5)
+
 async def demo_p2p_usage():
-    import os
     logging.basicConfig(level=logging.INFO)
     
     # Use environment variables
@@ -323,26 +1036,7 @@ async def demo_p2p_usage():
     connection_url = os.environ.get("CONNECTION_URL", "https://dstack-node.phala.network")
     rpc_url = os.environ.get("RPC_URL", "https://base.llamarpc.com")
     
-    # Smart socket detection for different environments
-    # Try different socket paths in order of preference
-    socket_paths = [
-        "/var/run/dstack.sock",          # Phala Cloud production
-        "./simulator/dstack.sock",       # Local development
-        "/app/simulator/dstack.sock",    # Docker container
-        "/tmp/dstack.sock"               # Alternative location
-    ]
-    
-    for path in socket_paths:
-        if os.path.exists(path):
-            dstack_socket = path
-            logger.info(f"Found DStack socket at: {path}")
-            break
-    
-    if not dstack_socket:
-        logger.error("No DStack socket found. Tried paths:")
-        for path in socket_paths:
-            logger.error(f"  - {path} (not found)")
-        dstack_socket = "/var/run/dstack.sock"  # Default fallback
+    dstack_socket = discover_dstack_socket()
     
     logger.info(f"Initializing DStack P2P SDK...")
     logger.info(f"Contract: {contract_address}")
@@ -351,23 +1045,22 @@ async def demo_p2p_usage():
     logger.info(f"DStack Socket: {dstack_socket}")
     
     # Wait for DStack agent to be ready (Phala Cloud startup timing)
-    import time
-    max_retries = 30
-    for attempt in range(max_retries):
-        try:
-            # Test DStack connection first
-            from dstack_sdk import DstackClient
-            test_client = DstackClient(dstack_socket)
-            test_client.info()  # This will fail if agent not ready
-            logger.info(f"DStack agent ready after {attempt + 1} attempts")
-            break
-        except Exception as e:
-            if attempt < max_retries - 1:
-                logger.info(f"DStack agent not ready (attempt {attempt + 1}/{max_retries}), waiting...")
-                time.sleep(2)
-            else:
-                logger.error(f"DStack agent never became ready: {e}")
-                return
+    # DstackClient() raises if the socket doesn't exist yet, so the client is
+    # created inside the probe (once the socket accepts connections) and kept
+    clients: List[DstackClient] = []
+
+    async def probe():
+        if not clients:
+            clients.append(DstackClient(dstack_socket))
+        return await asyncio.to_thread(clients[0].info)
+
+    try:
+        # Test DStack connection first; info() fails until the agent is ready
+        attempts = await wait_for_dstack_agent(probe, socket_path=dstack_socket)
+        logger.info(f"DStack agent ready after {attempts} attempts")
+    except Exception as e:
+        logger.error(f"DStack agent never became ready: {e}")
+        return
     
     try:
         sdk = DStackP2PSDK(contract_address, connection_url, rpc_url, dstack_socket)
@@ -396,4 +1089,4 @@ async def demo_p2p_usage():
         traceback.print_exc()
 
 if __name__ == "__main__":
-    asyncio.run(demo_p2p_usage())
+    run_async(demo_p2p_usage())
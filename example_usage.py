@@ -7,71 +7,61 @@ to get peer information from the DStack P2P cluster.
 """
 
 import asyncio
-import requests
+import importlib.util
+import httpx
 import json
-import time
 from typing import List, Dict
 
+# httpx only speaks HTTP/2 when the optional h2 package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
 
 class DStackAPIClient:
-    """Simple client for the DStack P2P FastAPI server"""
+    """Async client for the DStack P2P FastAPI server; independent calls can be awaited together"""
     
     def __init__(self, base_url: str = "https://7987d1133bc8ddfaf8639dbde4bb4d4d2f9152d0-8080.dstack-pha-prod7.phala.network"):
         self.base_url = base_url.rstrip('/')
+        # HTTP/2 multiplexes concurrent requests over one connection when available
+        self._client = httpx.AsyncClient(base_url=self.base_url, http2=HTTP2_AVAILABLE, timeout=10)
     
-    def health_check(self) -> Dict:
-        """Check if the API server is healthy"""
+    async def _request(self, method: str, path: str) -> Dict:
         try:
-            response = requests.get(f"{self.base_url}/health")
+            response = await self._client.request(method, path)
             response.raise_for_status()
             return response.json()
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             return {"error": str(e)}
     
-    def get_peers(self) -> Dict:
+    async def health_check(self) -> Dict:
+        """Check if the API server is healthy"""
+        return await self._request("GET", "/health")
+    
+    async def get_peers(self) -> Dict:
         """Get list of all peers in the cluster"""
-        try:
-            response = requests.get(f"{self.base_url}/peers")
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            return {"error": str(e)}
+        return await self._request("GET", "/peers")
     
-    def get_info(self) -> Dict:
+    async def get_info(self) -> Dict:
         """Get instance information"""
-        try:
-            response = requests.get(f"{self.base_url}/info")
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            return {"error": str(e)}
+        return await self._request("GET", "/info")
     
-    def mint_nft(self) -> Dict:
+    async def mint_nft(self) -> Dict:
         """Mint NFT for this instance"""
-        try:
-            response = requests.post(f"{self.base_url}/mint-nft")
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            return {"error": str(e)}
+        return await self._request("POST", "/mint-nft")
     
-    def get_contract_info(self) -> Dict:
+    async def get_contract_info(self) -> Dict:
         """Get contract configuration information"""
-        try:
-            response = requests.get(f"{self.base_url}/contract-info")
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            return {"error": str(e)}
+        return await self._request("GET", "/contract-info")
     
-    def register_instance(self) -> Dict:
+    async def register_instance(self) -> Dict:
         """Register this instance with the cluster (includes NFT minting)"""
-        try:
-            response = requests.post(f"{self.base_url}/register")
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            return {"error": str(e)}
+        return await self._request("POST", "/register")
+    
+    async def get_bootstrap(self) -> Dict:
+        """Get health, instance info and contract configuration in one request"""
+        return await self._request("GET", "/bootstrap")
+    
+    async def aclose(self):
+        await self._client.aclose()
 
 
 def print_json(data: Dict, title: str = ""):
@@ -81,7 +71,7 @@ def print_json(data: Dict, title: str = ""):
     print(json.dumps(data, indent=2))
 
 
-def main():
+async def main():
     """Main example function"""
     print("DStack P2P FastAPI Server - Example Usage")
     print("=" * 50)
@@ -89,9 +79,22 @@ def main():
     # Initialize client
     client = DStackAPIClient()
     
+    # Health, contract and instance info arrive together from /bootstrap; servers
+    # without it get the three read-only calls concurrently instead
+    bootstrap = await client.get_bootstrap()
+    if bootstrap.get("error"):
+        health, contract_info, info = await asyncio.gather(
+            client.health_check(),
+            client.get_contract_info(),
+            client.get_info(),
+        )
+    else:
+        health = bootstrap["health"]
+        contract_info = bootstrap["contract_info"]
+        info = bootstrap["info"]
+    
     # 1. Health Check
     print("\n1. Checking API health...")
-    health = client.health_check()
     print_json(health, "Health Status")
     
     if health.get("error"):
@@ -99,16 +102,15 @@ def main():
         print("   docker-compose -f docker-compose-fastapi.yml up -d")
         print("   OR")
         print("   uv run python fastapi_server.py")
+        await client.aclose()
         return
     
     # 2. Get Contract Info (NEW - to debug minting issues)
     print("\n2. Getting contract configuration...")
-    contract_info = client.get_contract_info()
     print_json(contract_info, "Contract Configuration")
     
     # 3. Get Instance Info
     print("\n3. Getting instance information...")
-    info = client.get_info()
     print_json(info, "Instance Info")
     
     # # 3. Get Peers
@@ -150,7 +152,8 @@ def main():
     
     # 5. Registration (if PRIVATE_KEY available)
     print("\n5. Testing full registration...")
-    registration = client.register_instance()
+    registration = await client.register_instance()
+    await client.aclose()
     print_json(registration, "Registration Result")
     
     if registration.get("error"):
@@ -177,12 +180,13 @@ async def monitoring_example():
     print("\nContinuous Peer Monitoring Example")
     print("=" * 40)
     
+    # Async client: each poll awaits the request instead of blocking the event loop
     client = DStackAPIClient()
     last_peers = []
     
     for i in range(10):  # Monitor for 10 iterations
         try:
-            peers_data = client.get_peers()
+            peers_data = await client.get_peers()
             
             if peers_data.get("error"):
                 print(f"Iteration {i+1}: Error - {peers_data['error']}")
@@ -205,6 +209,8 @@ async def monitoring_example():
             break
         except Exception as e:
             print(f"Iteration {i+1}: Unexpected error - {e}")
+    
+    await client.aclose()
 
 
 if __name__ == "__main__":
@@ -221,4 +227,4 @@ if __name__ == "__main__":
     if args.monitor:
         asyncio.run(monitoring_example())
     else:
-        main()
+        asyncio.run(main())
@@ -6,20 +6,31 @@ Provides REST API endpoints to interact with the dstack P2P SDK:
 - GET /peers - List all active peers in the cluster
 - GET /health - Health check endpoint
 - GET /info - Instance information
+- GET /contract-info - Cluster contract configuration
+- GET /bootstrap - Health, instance info and contract configuration in one call
+- GET /metrics - RPC, cache and batching counters (Prometheus text format)
 """
 
 import asyncio
+import json
 import logging
 import os
 import time
 from contextlib import asynccontextmanager
-from typing import Dict, Any, Optional
+from typing import Any, Dict, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 import uvicorn
 
-from dstack_cluster import DStackP2PSDK
-from eth_account import Account
+try:
+    import orjson  # noqa: F401 - ORJSONResponse needs it at response time
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    DefaultResponse = JSONResponse
+
+from dstack_cluster import DStackP2PSDK, discover_dstack_socket, single_flight, wait_for_dstack_agent
 
 # Configure logging
 logging.basicConfig(
@@ -31,6 +42,36 @@ logger = logging.getLogger(__name__)
 # Global SDK instance
 sdk: Optional[DStackP2PSDK] = None
 
+# The / payload never changes, so it is encoded once
+_ROOT_BODY = json.dumps({
+    "message": "DStack P2P Cluster API",
+    "version": "1.0.0",
+    "endpoints": {
+        "/peers": "List all active peers",
+        "/health": "Health check",
+        "/info": "Instance information",
+        "/contract-info": "Cluster contract configuration",
+        "/bootstrap": "Health, instance info and contract configuration in one call",
+        "/metrics": "RPC, cache and batching counters (Prometheus format)",
+        "/mint-nft": "Mint NFT for this instance",
+        "/register": "Register with P2P cluster (includes NFT minting)",
+        "/docs": "API documentation"
+    }
+}).encode()
+
+# Constant parts of the /health payload, encoded once; only the timestamp changes per request
+_HEALTH_PREFIX = b'{"status":"healthy","timestamp":'
+_HEALTH_SUFFIX = {True: b',"sdk_initialized":true}', False: b',"sdk_initialized":false}'}
+
+# Last rendered /peers list: (tuple of peers, encoded '"peers":[...],"count":N' fragment)
+_peers_fragment: Tuple[Optional[tuple], bytes] = (None, b"")
+
+# Token ID minted by this process; once known, later mint requests are no-ops
+_minted_token_id: Optional[int] = None
+
+# Pending mint/registration work by key; concurrent requests share one attempt
+_inflight: Dict[str, asyncio.Future] = {}
+
 
 async def mint_nft_if_needed(sdk_instance: DStackP2PSDK) -> bool:
     """
@@ -38,13 +79,22 @@ async def mint_nft_if_needed(sdk_instance: DStackP2PSDK) -> bool:
     
     This implements the CORRECT approach where the NFT Owner Address (the address
     with the private key) owns the NFT, not a derived "instance address".
+    Concurrent callers share one attempt, so only one mint transaction is sent.
     
     Returns: True if NFT exists or was successfully minted, False otherwise
     """
+    return await single_flight(_inflight, "mint", lambda: _mint_nft_if_needed(sdk_instance))
+
+
+async def _mint_nft_if_needed(sdk_instance: DStackP2PSDK) -> bool:
+    global _minted_token_id
+    
+    if _minted_token_id:
+        logger.info(f"NFT already minted by this instance with token ID: {_minted_token_id}")
+        return True
+    
     try:
-        private_key = os.environ["PRIVATE_KEY"]
-        account = Account.from_key(private_key)
-        nft_owner_address = account.address
+        nft_owner_address = sdk_instance.account.address
         
         logger.info(f"Checking NFT status for owner address: {nft_owner_address}")
         
@@ -60,7 +110,7 @@ async def mint_nft_if_needed(sdk_instance: DStackP2PSDK) -> bool:
         #     logger.warning(f"Could not check existing NFT status: {e}")
         
         # Get instance ID for the NFT metadata
-        info = sdk_instance.dstack.info()
+        info = await sdk_instance.get_dstack_info()
         instance_id = info.instance_id
         
         if not instance_id:
@@ -70,43 +120,51 @@ async def mint_nft_if_needed(sdk_instance: DStackP2PSDK) -> bool:
         logger.info(f"Minting NFT for owner address {nft_owner_address} with instance ID: {instance_id}")
         
         # Build and send mint transaction
-        mint_function = sdk_instance.contract.functions.mintNodeAccess(
+        mint_function = sdk_instance.mint_node_access_call(
             nft_owner_address,  # The NFT owner address (NOT derived from instance)
             instance_id         # Instance ID as metadata
         )
         
-        # Build transaction
-        tx = mint_function.build_transaction({
-            'from': nft_owner_address,
-            'nonce': sdk_instance.w3.eth.get_transaction_count(nft_owner_address),
-            'gas': 2000000,
-            'gasPrice': sdk_instance.w3.eth.gas_price,
-        })
-        
-        # Sign and send transaction
-        signed_tx = account.sign_transaction(tx)
-        tx_hash = sdk_instance.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+        # Build, sign and send with the SDK's transaction helper, then wait for confirmation
+        # (raises if the mint reverted)
+        receipt = await sdk_instance.send_transaction(mint_function, "mintNodeAccess")
+        logger.info(f"NFT minted successfully! Transaction: {receipt['transactionHash'].hex()}")
         
-        # Wait for confirmation
-        receipt = sdk_instance.w3.eth.wait_for_transaction_receipt(tx_hash)
+        # The minted token ID is in the receipt's Transfer event; only re-read it
+        # from the contract if the event isn't there
+        sdk_instance.invalidate_call("walletToTokenId", nft_owner_address)
+        token_id = sdk_instance.minted_token_id(receipt)
+        if token_id is None:
+            token_id = await sdk_instance.get_token_id(nft_owner_address)
+        logger.info(f"Verified NFT minted with token ID: {token_id}")
+        _minted_token_id = int(token_id)
         
-        if receipt['status'] == 1:
-            logger.info(f"NFT minted successfully! Transaction: {receipt['transactionHash'].hex()}")
-            
-            # Verify NFT was minted
-            token_id = sdk_instance.contract.functions.walletToTokenId(nft_owner_address).call()
-            logger.info(f"Verified NFT minted with token ID: {token_id}")
-            
-            return True
-        else:
-            logger.error(f"NFT minting transaction failed: {receipt['transactionHash'].hex()}")
-            return False
+        return True
             
     except Exception as e:
         logger.error(f"NFT minting failed: {e}")
         return False
 
 
+async def wait_for_token(sdk_instance: DStackP2PSDK, address: str, timeout: float = 10.0) -> bool:
+    """
+    Poll walletToTokenId until the address owns a token or `timeout` seconds pass.
+    
+    Returns: True once the token is visible, False on timeout
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            sdk_instance.invalidate_call("walletToTokenId", address)
+            if await sdk_instance.get_token_id(address) > 0:
+                return True
+        except Exception as e:
+            logger.debug(f"Token lookup failed: {e}")
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(0.5)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """FastAPI lifespan context manager for startup/shutdown"""
@@ -120,24 +178,7 @@ async def lifespan(app: FastAPI):
     connection_url = os.environ.get("CONNECTION_URL", "http://localhost:8080")
     rpc_url = os.environ.get("RPC_URL", "https://base.llamarpc.com")
     
-    # Smart socket detection for different environments
-    socket_paths = [
-        "/var/run/dstack.sock",          # Phala Cloud production
-        "./simulator/dstack.sock",       # Local development
-        "/app/simulator/dstack.sock",    # Docker container
-        "/tmp/dstack.sock"               # Alternative location
-    ]
-    
-    dstack_socket = None
-    for path in socket_paths:
-        if os.path.exists(path):
-            dstack_socket = path
-            logger.info(f"Found DStack socket at: {path}")
-            break
-    
-    if not dstack_socket:
-        logger.warning("No DStack socket found. Using default path.")
-        dstack_socket = "/var/run/dstack.sock"
+    dstack_socket = discover_dstack_socket()
     
     logger.info("Initializing DStack P2P SDK...")
     logger.info(f"Contract: {contract_address}")
@@ -149,22 +190,15 @@ async def lifespan(app: FastAPI):
         # Initialize SDK
         sdk = DStackP2PSDK(contract_address, connection_url, rpc_url, dstack_socket)
         
-        # Wait for DStack agent to be ready
-        max_retries = 30
-        for attempt in range(max_retries):
-            try:
-                from dstack_sdk import DstackClient
-                test_client = DstackClient(dstack_socket)
-                test_client.info()
-                logger.info(f"DStack agent ready after {attempt + 1} attempts")
-                break
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    logger.info(f"DStack agent not ready (attempt {attempt + 1}/{max_retries}), waiting...")
-                    await asyncio.sleep(2)
-                else:
-                    logger.error(f"DStack agent never became ready: {e}")
-                    raise
+        # Wait for DStack agent to be ready: the socket must accept connections
+        # and the agent must answer an info() request, checked in one loop
+        try:
+            # Fetched through the SDK so the successful response is cached for minting/registration
+            attempts = await wait_for_dstack_agent(sdk.get_dstack_info, socket_path=dstack_socket)
+            logger.info(f"DStack agent ready after {attempts} attempts")
+        except Exception as e:
+            logger.error(f"DStack agent never became ready: {e}")
+            raise
         
         # Mint NFT and register with the cluster if PRIVATE_KEY is provided
         if os.environ.get("PRIVATE_KEY"):
@@ -177,8 +211,10 @@ async def lifespan(app: FastAPI):
             else:
                 logger.warning("NFT minting failed - continuing anyway")
 
-            logger.info("Sleeping for 10 seconds...")
-            time.sleep(10)
+            # Give the RPC node time to reflect the mint, without blocking the event loop
+            logger.info("Waiting for the NFT to be visible on-chain...")
+            if not await wait_for_token(sdk, sdk.account.address):
+                logger.warning("NFT not visible after waiting - registering anyway")
             
             # Then register with the P2P cluster
             logger.info("Registering with P2P cluster...")
@@ -205,39 +241,29 @@ app = FastAPI(
     title="DStack P2P Cluster API",
     description="REST API for DStack P2P cluster management and peer discovery",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=DefaultResponse
 )
 
+# /peers grows with the cluster and is polled by every peer; small bodies go out as-is
+app.add_middleware(GZipMiddleware, minimum_size=512)
+
 
 @app.get("/")
-async def root():
+async def root() -> Response:
     """Root endpoint with basic API information"""
-    return {
-        "message": "DStack P2P Cluster API",
-        "version": "1.0.0",
-        "endpoints": {
-            "/peers": "List all active peers",
-            "/health": "Health check",
-            "/info": "Instance information",
-            "/mint-nft": "Mint NFT for this instance",
-            "/register": "Register with P2P cluster (includes NFT minting)",
-            "/docs": "API documentation"
-        }
-    }
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "timestamp": time.time(),
-        "sdk_initialized": sdk is not None
-    }
+    body = _HEALTH_PREFIX + repr(time.time()).encode() + _HEALTH_SUFFIX[sdk is not None]
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/peers")
-async def list_peers() -> Dict[str, Any]:
+async def list_peers() -> Response:
     """
     List all active peers in the cluster
     
@@ -247,15 +273,23 @@ async def list_peers() -> Dict[str, Any]:
     if not sdk:
         raise HTTPException(status_code=503, detail="SDK not initialized")
     
+    global _peers_fragment
+    
     try:
         peers = await sdk.get_peers()
         
-        return {
-            "peers": peers,
-            "count": len(peers),
-            "timestamp": time.time(),
-            "instance_id": getattr(sdk, 'instance_id', None)
-        }
+        # The peer list rarely changes, so only re-encode it when it does
+        key = tuple(peers)
+        if _peers_fragment[0] != key:
+            _peers_fragment = (key, f'"peers":{json.dumps(peers)},"count":{len(peers)}'.encode())
+        
+        body = b"".join((
+            b"{", _peers_fragment[1],
+            b',"timestamp":', repr(time.time()).encode(),
+            b',"instance_id":', json.dumps(getattr(sdk, 'instance_id', None)).encode(),
+            b"}",
+        ))
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
         logger.error(f"Failed to get peers: {e}")
@@ -290,6 +324,72 @@ async def instance_info() -> Dict[str, Any]:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve instance info: {str(e)}")
 
 
+
+# uint256 values (mintPrice in wei) can exceed orjson's 64-bit integer range,
+# so routes returning them use the stdlib encoder
+@app.get("/contract-info", response_class=JSONResponse)
+async def contract_info() -> Dict[str, Any]:
+    """
+    Get the cluster contract configuration
+    
+    Returns:
+        Dict containing owner, publicMinting, mintPrice and maxNodes
+    """
+    if not sdk:
+        raise HTTPException(status_code=503, detail="SDK not initialized")
+    
+    try:
+        config = await sdk.get_contract_config()
+        
+        return {
+            "contract_address": sdk.contract_address,
+            **config,
+            "timestamp": time.time()
+        }
+        
+    except Exception as e:
+        logger.error(f"Failed to get contract info: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve contract info: {str(e)}")
+
+
+@app.get("/bootstrap", response_class=JSONResponse)
+async def bootstrap() -> Dict[str, Any]:
+    """
+    Everything a client reads on startup, in one round-trip
+    
+    Returns:
+        Dict with the /health, /info and /contract-info payloads; a section
+        that fails carries {"error": ...} instead
+    """
+    async def section(endpoint):
+        try:
+            return await endpoint()
+        except HTTPException as e:
+            return {"error": e.detail}
+    
+    info, contract = await asyncio.gather(section(instance_info), section(contract_info))
+    return {
+        "health": {"status": "healthy", "timestamp": time.time(), "sdk_initialized": sdk is not None},
+        "info": info,
+        "contract_info": contract
+    }
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """SDK RPC, cache and batching counters in the Prometheus text format"""
+    lines = []
+    if sdk:
+        typed = set()
+        for (name, labels), value in sorted(sdk.metrics.items()):
+            metric = f"dstack_sdk_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
 @app.post("/mint-nft")
 async def mint_nft():
     """
@@ -309,10 +409,8 @@ async def mint_nft():
         
         if success:
             # Get owner address and token info
-            private_key = os.environ["PRIVATE_KEY"]
-            account = Account.from_key(private_key)
-            nft_owner_address = account.address
-            token_id = sdk.contract.functions.walletToTokenId(nft_owner_address).call()
+            nft_owner_address = sdk.account.address
+            token_id = _minted_token_id or await sdk.get_token_id(nft_owner_address)
             
             return {
                 "status": "success",
@@ -330,14 +428,8 @@ async def mint_nft():
         raise HTTPException(status_code=500, detail=f"NFT minting failed: {str(e)}")
 
 
-@app.post("/register")
-async def register():
-    """
-    Register this instance with the P2P cluster
-    
-    This will first attempt to mint an NFT if needed, then register the instance.
-    Requires PRIVATE_KEY environment variable to be set.
-    """
+async def _register_with(sdk_method: str, message: str, mint_first: bool) -> Dict[str, Any]:
+    """Shared body of the /register* endpoints: optionally mint, then call one SDK registration method"""
     if not sdk:
         raise HTTPException(status_code=503, detail="SDK not initialized")
     
@@ -345,19 +437,19 @@ async def register():
         raise HTTPException(status_code=400, detail="PRIVATE_KEY environment variable required for registration")
     
     try:
-        # First ensure NFT is minted
-        mint_success = await mint_nft_if_needed(sdk)
-        if not mint_success:
-            logger.warning("NFT minting failed, but continuing with registration")
+        if mint_first:
+            # First ensure NFT is minted
+            mint_success = await mint_nft_if_needed(sdk)
+            if not mint_success:
+                logger.warning("NFT minting failed, but continuing with registration")
         
-        # Then register with the cluster
-        success = await sdk.register()
+        # Then register with the cluster (concurrent requests share one attempt)
+        success = await single_flight(_inflight, sdk_method, getattr(sdk, sdk_method))
         
         if success:
             return {
                 "status": "success",
-                "message": "Successfully registered with P2P cluster",
-                # "nft_minted": mint_success,
+                "message": message,
                 "instance_id": getattr(sdk, 'instance_id', None),
                 "timestamp": time.time()
             }
@@ -369,85 +461,53 @@ async def register():
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
 
 
-@app.post("/register-instance")
-async def register_instance():
-    """
-    Register this instance with the P2P cluster
-    
-    This will first attempt to mint an NFT if needed, then register the instance.
-    Requires PRIVATE_KEY environment variable to be set.
-    """
-    if not sdk:
-        raise HTTPException(status_code=503, detail="SDK not initialized")
-    
-    if not os.environ.get("PRIVATE_KEY"):
-        raise HTTPException(status_code=400, detail="PRIVATE_KEY environment variable required for registration")
-    
-    try:
-        # Then register with the cluster
-        success = await sdk.register_instance()
-        
-        if success:
-            return {
-                "status": "success",
-                "message": "Successfully registered instance with P2P cluster",
-                # "nft_minted": mint_success,
-                "instance_id": getattr(sdk, 'instance_id', None),
-                "timestamp": time.time()
-            }
-        else:
-            raise HTTPException(status_code=500, detail="Registration failed")
-            
-    except Exception as e:
-        logger.error(f"Registration failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
+# Registration endpoints: (path, SDK method, success message, mint the NFT first, description)
+REGISTRATION_ROUTES = [
+    ("/register", "register", "Successfully registered with P2P cluster", True,
+     "Register this instance with the P2P cluster. Mints the NFT first if needed. "
+     "Requires PRIVATE_KEY environment variable to be set."),
+    ("/register-instance", "register_instance", "Successfully registered instance with P2P cluster", False,
+     "Register this instance (registerInstance only). Requires PRIVATE_KEY environment variable to be set."),
+    ("/register-peer", "register_peer", "Successfully registered peer with P2P cluster", False,
+     "Register this peer (registerPeer only). Requires PRIVATE_KEY environment variable to be set."),
+]
 
 
+def _registration_endpoint(sdk_method: str, message: str, mint_first: bool):
+    async def endpoint():
+        return await _register_with(sdk_method, message, mint_first)
+    return endpoint
+
+
+for _path, _sdk_method, _message, _mint_first, _description in REGISTRATION_ROUTES:
+    app.post(_path, name=_sdk_method, description=_description)(
+        _registration_endpoint(_sdk_method, _message, _mint_first)
+    )
 
-@app.post("/register-peer")
-async def register_peer():
-    """
-    Register this peer with the P2P cluster
-    
-    This will first attempt to mint an NFT if needed, then register the instance.
-    Requires PRIVATE_KEY environment variable to be set.
-    """
-    if not sdk:
-        raise HTTPException(status_code=503, detail="SDK not initialized")
-    
-    if not os.environ.get("PRIVATE_KEY"):
-        raise HTTPException(status_code=400, detail="PRIVATE_KEY environment variable required for registration")
-    
-    try:
-        # Then register with the cluster
-        success = await sdk.register_peer()
-        
-        if success:
-            return {
-                "status": "success",
-                "message": "Successfully registered peer with P2P cluster",
-                # "nft_minted": mint_success,
-                "instance_id": getattr(sdk, 'instance_id', None),
-                "timestamp": time.time()
-            }
-        else:
-            raise HTTPException(status_code=500, detail="Registration failed")
-            
-    except Exception as e:
-        logger.error(f"Registration failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
 
 def main():
     """Main entry point for the FastAPI server"""
     port = int(os.environ.get("PORT", 8080))
     host = os.environ.get("HOST", "0.0.0.0")
+    # Each worker runs its own lifespan (SDK, mint, registration, nonce tracking),
+    # so more than one is only safe for read-only deployments
+    workers = int(os.environ.get("WORKERS", 1))
+    if workers > 1 and os.environ.get("PRIVATE_KEY"):
+        logger.warning(f"PRIVATE_KEY is set - ignoring WORKERS={workers} and running a single worker "
+                       "so transactions aren't sent concurrently from the same account")
+        workers = 1
     
-    logger.info(f"Starting FastAPI server on {host}:{port}")
+    logger.info(f"Starting FastAPI server on {host}:{port} with {workers} worker(s)")
     
     uvicorn.run(
         "fastapi_server:app",
         host=host,
         port=port,
+        # Both ship with uvicorn[standard]; naming them makes a missing install fail loudly
+        # instead of silently falling back to asyncio + h11
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
         log_level="info",
         access_log=True
     )
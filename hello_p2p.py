@@ -12,42 +12,80 @@ import asyncio
 import logging
 import argparse
 import json
+import logging.handlers
+import queue
+import random
+import signal
+import statistics
 import time
-from typing import List
+from collections import deque
+from typing import List, Optional
 from aiohttp import web, ClientSession
 import aiohttp
 
-from dstack_cluster import DStackP2PSDK
+from dstack_cluster import DStackP2PSDK, run_async
+
+try:
+    import orjson
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    _json_dumps = json.dumps
 
 logger = logging.getLogger(__name__)
 
+# HTTP endpoints for peer communication: (method, path, handler attribute)
+ROUTES = [
+    ('GET', '/hello', 'handle_hello'),
+    ('GET', '/info', 'handle_info'),
+    ('GET', '/peers', 'handle_peers'),
+]
+
+
+def json_response(data, **kwargs) -> web.Response:
+    """web.json_response using orjson when it is installed"""
+    return web.json_response(data, dumps=_json_dumps, **kwargs)
+
 class HelloP2PApp:
-    def __init__(self, contract_address: str, port: int = 8080):
+    def __init__(self, contract_address: str, port: int = 8080, connection_url: Optional[str] = None):
         self.instance_id = None  # Will be obtained from DStack SDK
         self.port = port
+        self.started_at = time.monotonic()  # For uptime; monotonic so clock steps don't skew it
         self.peers = []
         self.peer_info = {}  # Store info about discovered peers
+        self._peers_key = frozenset()  # Set form of self.peers, for change detection
+        self.rtt_samples = deque(maxlen=64)  # Recent peer round-trip times (seconds)
         
         # Initialize P2P SDK - the magical 3-line interface!
-        connection_url = f"http://localhost:{self.port}"
-        self.sdk = DStackP2PSDK(contract_address, connection_url)
+        self.connection_url = connection_url or f"http://localhost:{self.port}"
+        self.sdk = DStackP2PSDK(contract_address, self.connection_url)
         
         # HTTP server for peer communication
         self.app = web.Application()
         self.setup_routes()
         
+        # Shared client session for talking to peers and the server's runner
+        # (both created in start_server, released in stop_server)
+        self.http_session: Optional[ClientSession] = None
+        self.runner: Optional[web.AppRunner] = None
+        
+        # Set by SIGINT/SIGTERM to shut the app down
+        self.stop_event = asyncio.Event()
+        
     def setup_routes(self):
         """Setup HTTP endpoints for peer communication"""
-        self.app.router.add_get('/hello', self.handle_hello)
-        self.app.router.add_get('/info', self.handle_info)
-        self.app.router.add_get('/peers', self.handle_peers)
+        self.app.add_routes([
+            web.route(method, path, getattr(self, handler))
+            for method, path, handler in ROUTES
+        ])
         
     async def handle_hello(self, request):
         """Handle incoming hello requests from peers"""
         remote_id = request.query.get('from', 'unknown')
-        logger.info(f"Received hello from peer: {remote_id}")
+        logger.info("Received hello from peer: %s", remote_id)
         
-        return web.json_response({
+        return json_response({
             'message': f'Hello from {self.instance_id}!',
             'timestamp': time.time(),
             'peers_known': len(self.peers)
@@ -55,16 +93,17 @@ class HelloP2PApp:
         
     async def handle_info(self, request):
         """Return info about this instance"""
-        return web.json_response({
+        return json_response({
             'instance_id': self.instance_id,
             'connection_url': self.connection_url,
             'peers_count': len(self.peers),
-            'uptime': time.time()
+            'greet_timeout': self.greet_timeout(),
+            'uptime': time.monotonic() - self.started_at
         })
         
     async def handle_peers(self, request):
         """Return list of known peers"""
-        return web.json_response({
+        return json_response({
             'peers': self.peers,
             'peer_info': self.peer_info
         })
@@ -99,115 +138,182 @@ class HelloP2PApp:
             # Filter out our own URL
             new_peers = [peer for peer in current_peers if peer != self.connection_url]
             
-            if new_peers != self.peers:
-                logger.info(f"🔍 Peer list updated: {len(new_peers)} peers found")
+            # Compare as a set: a reordered but identical list needs no work
+            peers_key = frozenset(new_peers)
+            if peers_key != self._peers_key:
+                self._peers_key = peers_key
+                logger.info("🔍 Peer list updated: %d peers found", len(new_peers))
                 self.peers = new_peers
                 
+                # Forget peers that left the cluster so peer_info stays bounded
+                for stale in self.peer_info.keys() - set(new_peers):
+                    del self.peer_info[stale]
+                
                 # Say hello to new peers
                 await self.greet_peers()
                 
         except Exception as e:
-            logger.error(f"Peer discovery failed: {e}")
+            logger.error("Peer discovery failed: %s", e)
             
+    def greet_timeout(self) -> float:
+        """Per-peer request timeout derived from observed round-trip times (mean + 3 stddev)"""
+        if len(self.rtt_samples) < 5:
+            return 5.0
+        mu = statistics.fmean(self.rtt_samples)
+        sigma = statistics.pstdev(self.rtt_samples)
+        return min(5.0, max(1.0, mu + 3 * sigma))
+        
     async def greet_peers(self):
         """Send hello messages to all known peers"""
         if not self.peers:
             logger.info("💭 No peers to greet yet")
             return
             
-        logger.info(f"👋 Greeting {len(self.peers)} peers...")
-        
-        async with ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
-            for peer_url in self.peers:
-                try:
-                    # Extract base URL for HTTP requests
-                    if peer_url.startswith('http'):
-                        hello_url = f"{peer_url}/hello?from={self.instance_id}"
-                    else:
-                        # Handle IP:port format
-                        hello_url = f"http://{peer_url}/hello?from={self.instance_id}"
-                        
-                    async with session.get(hello_url) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            logger.info(f"📨 Response from peer: {data.get('message')}")
-                            
-                            # Store peer info
-                            self.peer_info[peer_url] = {
-                                'last_contact': time.time(),
-                                'response': data
-                            }
-                        else:
-                            logger.warning(f"⚠️  Peer {peer_url} returned status {response.status}")
-                            
-                except Exception as e:
-                    logger.debug(f"Could not reach peer {peer_url}: {e}")
+        logger.info("👋 Greeting %d peers...", len(self.peers))
+        
+        # Greet concurrently (at most 16 in flight) so a cycle takes about one RTT
+        # rather than one per peer
+        timeout = aiohttp.ClientTimeout(total=self.greet_timeout())
+        semaphore = asyncio.Semaphore(16)
+        
+        async def greet(peer_url):
+            async with semaphore:
+                await self.greet_peer(peer_url, timeout)
+        
+        await asyncio.gather(*(greet(peer_url) for peer_url in self.peers))
+        
+    async def greet_peer(self, peer_url: str, timeout: aiohttp.ClientTimeout):
+        """Send a hello message to one peer and record its response"""
+        try:
+            # Extract base URL for HTTP requests
+            if peer_url.startswith('http'):
+                hello_url = f"{peer_url}/hello?from={self.instance_id}"
+            else:
+                # Handle IP:port format
+                hello_url = f"http://{peer_url}/hello?from={self.instance_id}"
+                
+            started = time.perf_counter()
+            async with self.http_session.get(hello_url, timeout=timeout) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    self.rtt_samples.append(time.perf_counter() - started)
+                    logger.info("📨 Response from peer: %s", data.get('message'))
+                    
+                    # Store peer info
+                    self.peer_info[peer_url] = {
+                        'last_contact': time.time(),
+                        'response': data
+                    }
+                else:
+                    logger.warning("⚠️  Peer %s returned status %s", peer_url, response.status)
+                    
+        except Exception as e:
+            logger.debug("Could not reach peer %s: %s", peer_url, e)
                     
     async def peer_monitor_loop(self):
         """Continuously monitor for new peers and communicate"""
         while True:
             try:
                 await self.discover_peers()
-                await asyncio.sleep(10)  # Check for new peers every 10 seconds
+                # Check for new peers about every 10 seconds; the jitter keeps nodes
+                # started together from polling (and greeting) in lockstep
+                await asyncio.sleep(10 + random.uniform(-1, 1))
                 
             except Exception as e:
-                logger.error(f"Peer monitor error: {e}")
+                logger.error("Peer monitor error: %s", e)
                 await asyncio.sleep(5)
                 
     async def start_server(self):
         """Start the HTTP server"""
-        runner = web.AppRunner(self.app)
-        await runner.setup()
+        # One keep-alive session for all peer greetings, reused every cycle; peer
+        # hostnames are resolved once per 5 minutes rather than aiohttp's default 10s
+        self.http_session = ClientSession(
+            connector=aiohttp.TCPConnector(limit=64, keepalive_timeout=30, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=5)
+        )
         
-        site = web.TCPSite(runner, '0.0.0.0', self.port)
+        # Access-log lines are only formatted when running verbose
+        access_log = logger if logger.isEnabledFor(logging.DEBUG) else None
+        self.runner = web.AppRunner(self.app, access_log=access_log)
+        await self.runner.setup()
+        
+        site = web.TCPSite(self.runner, '0.0.0.0', self.port)
         await site.start()
         
         logger.info(f"🚀 HTTP server started on port {self.port}")
         
+    async def stop_server(self):
+        """Close the peer client session and stop the HTTP server"""
+        if self.http_session is not None:
+            await self.http_session.close()
+        if self.runner is not None:
+            await self.runner.cleanup()
+        
+    async def __aenter__(self):
+        await self.start_server()
+        return self
+        
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop_server()
+        
     async def run(self):
         """Main application loop"""
         logger.info("🌟 Starting Hello P2P App")
         
-        # Start HTTP server
-        await self.start_server()
-        
-        # Register with cluster (this will set self.instance_id)
-        if await self.register_with_cluster():
+        # HTTP server runs for the lifetime of this block and is always torn down
+        async with self:
+            # Register with cluster (this will set self.instance_id)
+            if not await self.register_with_cluster():
+                logger.error("💥 Failed to start - could not register with cluster")
+                return
+            
             # Start peer monitoring
             monitor_task = asyncio.create_task(self.peer_monitor_loop())
             
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, self.stop_event.set)
+            
             logger.info(f"✨ Hello P2P App ({self.instance_id}) is running! Press Ctrl+C to stop")
             
             try:
-                await monitor_task
-            except KeyboardInterrupt:
+                await self.stop_event.wait()
                 logger.info(f"👋 Shutting down Hello P2P App ({self.instance_id})")
+            finally:
                 monitor_task.cancel()
-        else:
-            logger.error("💥 Failed to start - could not register with cluster")
 
 async def main():
     parser = argparse.ArgumentParser(description="Simple P2P Hello Application")
     parser.add_argument("contract_address", help="Smart contract address")
     parser.add_argument("--port", type=int, default=8080, help="HTTP server port")
+    parser.add_argument("--connection-url", help="URL peers use to reach this node (default: http://localhost:PORT)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging")
     
     args = parser.parse_args()
     
-    # Setup logging
+    # Setup logging; records are written to stderr by a listener thread so the
+    # event loop never blocks on terminal or pipe I/O
     log_level = logging.DEBUG if args.verbose else logging.INFO
-    logging.basicConfig(
-        level=log_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    
-    # Create and run the app - ultra-simple interface!
-    app = HelloP2PApp(
-        contract_address=args.contract_address,
-        port=args.port
-    )
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(log_level)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
     
-    await app.run()
+    try:
+        # Create and run the app - ultra-simple interface!
+        app = HelloP2PApp(
+            contract_address=args.contract_address,
+            port=args.port,
+            connection_url=args.connection_url
+        )
+        
+        await app.run()
+    finally:
+        listener.stop()  # Flushes whatever is still queued
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    run_async(main())
\ No newline at end of file
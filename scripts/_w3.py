@@ -0,0 +1,23 @@
+"""
+Shared Web3 connection for the test scripts.
+
+One Web3 per RPC URL, backed by a keep-alive requests.Session, so the calls a
+script makes reuse the same TCP/TLS connection instead of reconnecting.
+"""
+
+from typing import Dict
+
+import requests
+from web3 import Web3
+from web3.middleware import simple_cache_middleware
+
+_W3: Dict[str, Web3] = {}
+
+def get_w3(rpc_url: str) -> Web3:
+    """Cached Web3 for rpc_url (eth_chainId and other static lookups are served from cache)"""
+    w3 = _W3.get(rpc_url)
+    if w3 is None:
+        provider = Web3.HTTPProvider(rpc_url, request_kwargs={"timeout": 30}, session=requests.Session())
+        w3 = _W3[rpc_url] = Web3(provider)
+        w3.middleware_onion.add(simple_cache_middleware)
+    return w3
@@ -4,24 +4,36 @@ Test script for DstackMembershipNFT contract signature verification.
 Tests the fixed signature chain verification logic with real contract calls.
 """
 
+import asyncio
+import functools
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from web3 import Web3
 from eth_account import Account
-from signature_proof import SignatureProofGenerator
-from eth_keys import keys
+from signature_proof import SignatureProofGenerator, recover_addresses
+from eth_abi import encode as abi_encode
 from eth_utils import keccak
-import json
 
 # Test configuration
 RPC_URL = "http://localhost:8545"
 PRIVATE_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"  # Anvil default
 KMS_ROOT_PRIVATE_KEY = "e0e5d254fb944dcc370a2e5288b336a1e809871545a73ee645368957fefa31f9"
 KMS_ROOT_ADDRESS = Account.from_key(KMS_ROOT_PRIVATE_KEY).address
+KMS_ROOT_ADDRESS_LOWER = KMS_ROOT_ADDRESS.lower()
 CONTRACT_ADDRESS = "0x5067457698Fd6Fa1C6964e416b3f42713513B3dD"  # Simplified contract without redundant parameters
 
+# Calldata is built directly with eth_abi (same selectors as dstack_cluster.py), so
+# the format-only path doesn't have to import web3 or the SDK
+REGISTER_INSTANCE_SELECTOR = keccak(text="registerInstance(string)")[:4]
+REGISTER_PEER_TYPES = ["string", "bytes", "bytes", "bytes", "bytes", "string", "string", "bytes32"]
+REGISTER_PEER_SELECTOR = keccak(text=f"registerPeer({','.join(REGISTER_PEER_TYPES)})")[:4]
+
+@functools.lru_cache(maxsize=128)
+def _keccak_bytes(message: bytes) -> bytes:
+    """keccak256 memoized by message; formats 1 and 3 hash the same bytes"""
+    return keccak(message)
+
 def test_signature_formats():
     """Compare signature formats between working and current implementation"""
     print("🔍 Testing Different Signature Formats")
@@ -29,41 +41,56 @@ def test_signature_formats():
     
     try:
         # Generate signature proof using DStack simulator
-        generator = SignatureProofGenerator('./simulator/dstack.sock')
+        generator = SignatureProofGenerator.shared('./simulator/dstack.sock')
         proof = generator.generate_proof('wallet/ethereum', 'ethereum')  # Use 'ethereum' like dstack_cluster.py
         print(f"✅ Generated signature proof")
         print(f"   App ID: {proof.app_id}")
         
-        # Get keys
-        derived_public_key = keys.PrivateKey(proof.derived_private_key).public_key
-        derived_pubkey_sec1 = derived_public_key.to_compressed_bytes()
+        # SEC1 derived public key, computed once (via libsecp256k1) by generate_proof
+        derived_pubkey_sec1 = proof.derived_public_key
+        
+        # Hash every candidate message up front so all five recoveries run in one pass
+        app_message = f"ethereum:{derived_pubkey_sec1.hex()}"
+        eth_prefix = f"\x19Ethereum Signed Message:\n{len(app_message)}"
+        app_message_hash_working = _keccak_bytes(bytes(app_message, 'utf-8'))  # Raw keccak256
+        app_message_hash_current = _keccak_bytes((eth_prefix + app_message).encode())
+        app_message_hash_dstack = _keccak_bytes(app_message.encode())  # Same as keccak(text=...)
+        
+        # Decode the app ID once; test_contract_call reuses the 32-byte form
+        app_id_bytes = bytes.fromhex(proof.app_id.removeprefix('0x'))
+        app_id_bytes20 = app_id_bytes[:20]  # First 20 bytes
+        app_id_bytes32 = app_id_bytes.ljust(32, b'\x00')[:32]
+        
+        # App public key recovered by generate_proof - using the working hash format
+        app_pubkey_sec1 = proof.app_public_key
+        kms_hash_working = _keccak_bytes(b"dstack-kms-issued:" + app_id_bytes20 + app_pubkey_sec1)
+        kms_hash_current = _keccak_bytes(b"dstack-kms-issued:" + app_id_bytes32 + app_pubkey_sec1)
+        
+        (app_signer_working, app_signer_current, app_signer_dstack,
+         kms_signer_working, kms_signer_current) = recover_addresses([
+            (proof.app_signature, app_message_hash_working),
+            (proof.app_signature, app_message_hash_current),
+            (proof.app_signature, app_message_hash_dstack),
+            (proof.kms_signature, kms_hash_working),
+            (proof.kms_signature, kms_hash_current),
+        ])
         
         # Test 1: Working format (from SimpleDstackVerifier)
         print(f"\n🔬 Format 1: Working SimpleDstackVerifier format")
-        app_message_working = f"ethereum:{derived_pubkey_sec1.hex()}"
-        app_message_hash_working = keccak(bytes(app_message_working, 'utf-8'))  # Raw keccak256
-        app_signer_working = Account._recover_hash(app_message_hash_working, signature=proof.app_signature)
-        print(f"   Message: {app_message_working}")
+        print(f"   Message: {app_message}")
         print(f"   Hash: {app_message_hash_working.hex()}")
         print(f"   Recovered: {app_signer_working}")
         
         # Test 2: Current format (from our contract)
         print(f"\n🔬 Format 2: Current DstackMembershipNFT format")
-        app_message_current = f"ethereum:{derived_pubkey_sec1.hex()}"
-        eth_prefix = f"\x19Ethereum Signed Message:\n{len(app_message_current)}"
-        app_message_hash_current = keccak((eth_prefix + app_message_current).encode())
-        app_signer_current = Account._recover_hash(app_message_hash_current, signature=proof.app_signature)
-        print(f"   Message: {app_message_current}")
-        print(f"   Prefixed: {eth_prefix + app_message_current}")
+        print(f"   Message: {app_message}")
+        print(f"   Prefixed: {eth_prefix + app_message}")
         print(f"   Hash: {app_message_hash_current.hex()}")
         print(f"   Recovered: {app_signer_current}")
         
         # Test 3: What DStack actually produces (from signature_proof.py)
         print(f"\n🔬 Format 3: signature_proof.py format")
-        app_message_dstack = f"ethereum:{derived_pubkey_sec1.hex()}"
-        app_message_hash_dstack = keccak(text=app_message_dstack)  # This uses text encoding
-        app_signer_dstack = Account._recover_hash(app_message_hash_dstack, signature=proof.app_signature)
-        print(f"   Message: {app_message_dstack}")
+        print(f"   Message: {app_message}")
         print(f"   Hash: {app_message_hash_dstack.hex()}")
         print(f"   Recovered: {app_signer_dstack}")
         
@@ -74,37 +101,26 @@ def test_signature_formats():
         
         # Test KMS message formats
         print(f"\n🔬 KMS Message Formats:")
-        app_id_bytes20 = bytes.fromhex(proof.app_id.replace('0x', ''))[:20]  # First 20 bytes
-        app_id_bytes32 = bytes.fromhex(proof.app_id.replace('0x', '')).ljust(32, b'\x00')[:32]
-        
-        # Get app public key from signature - using the working hash format
-        app_signature_obj = keys.Signature(proof.app_signature)
-        app_pubkey_sec1 = app_signature_obj.recover_public_key_from_msg_hash(app_message_hash_working).to_compressed_bytes()
-        
         print(f"   App address from working format: {app_signer_working}")
         print(f"   App public key from signature: {app_pubkey_sec1.hex()}")
         
         # Format 1: Working format (20 bytes app ID)
-        kms_message_working = b"dstack-kms-issued:" + app_id_bytes20 + app_pubkey_sec1
-        kms_hash_working = keccak(kms_message_working)
-        kms_signer_working = Account._recover_hash(kms_hash_working, signature=proof.kms_signature)
+        kms_working = kms_signer_working.lower() == KMS_ROOT_ADDRESS_LOWER
         print(f"   Working KMS recovered: {kms_signer_working}")
-        print(f"   Working KMS matches: {kms_signer_working.lower() == KMS_ROOT_ADDRESS.lower()}")
+        print(f"   Working KMS matches: {kms_working}")
         
         # Format 2: Current format (32 bytes app ID)
-        kms_message_current = b"dstack-kms-issued:" + app_id_bytes32 + app_pubkey_sec1
-        kms_hash_current = keccak(kms_message_current)
-        kms_signer_current = Account._recover_hash(kms_hash_current, signature=proof.kms_signature)
         print(f"   Current KMS recovered: {kms_signer_current}")
-        print(f"   Current KMS matches: {kms_signer_current.lower() == KMS_ROOT_ADDRESS.lower()}")
+        print(f"   Current KMS matches: {kms_signer_current.lower() == KMS_ROOT_ADDRESS_LOWER}")
         
         return {
             'proof': proof,
             'derived_pubkey_sec1': derived_pubkey_sec1,
             'app_pubkey_sec1': app_pubkey_sec1,
+            'app_id_bytes32': app_id_bytes32,
             'app_signer': app_signer_working,  # Use the working format
             'working_format': app_signer_working != '0x0000000000000000000000000000000000000000',
-            'kms_working': kms_signer_working.lower() == KMS_ROOT_ADDRESS.lower()
+            'kms_working': kms_working
         }
         
     except Exception as e:
@@ -113,7 +129,7 @@ def test_signature_formats():
         traceback.print_exc()
         return None
 
-def test_contract_call(test_data):
+async def test_contract_call(test_data):
     """Test actual contract call with working format"""
     print(f"\n📜 Testing Contract Call")
     print("=" * 60)
@@ -122,59 +138,25 @@ def test_contract_call(test_data):
         print("❌ Skipping contract test - signature format not working")
         return False
     
+    # web3 is only needed here; importing it lazily keeps the format-only path fast
+    from web3 import AsyncHTTPProvider, AsyncWeb3
+    
     try:
         # Connect to blockchain
-        w3 = Web3(Web3.HTTPProvider(RPC_URL))
-        if not w3.is_connected():
+        w3 = AsyncWeb3(AsyncHTTPProvider(RPC_URL))
+        if not await w3.is_connected():
             print("❌ Failed to connect to blockchain")
             return False
         
-        account = w3.eth.account.from_key(PRIVATE_KEY)
+        account = Account.from_key(PRIVATE_KEY)
         print(f"🔗 Connected as: {account.address}")
-        
-        # Simplified contract ABI for registerPeer
-        contract_abi = [{
-            "inputs": [
-                {"name": "instanceId", "type": "string"},
-                {"name": "derivedPublicKey", "type": "bytes"},
-                {"name": "appPublicKey", "type": "bytes"},
-                {"name": "appSignature", "type": "bytes"},
-                {"name": "kmsSignature", "type": "bytes"},
-                {"name": "connectionUrl", "type": "string"},
-                {"name": "purpose", "type": "string"},
-                {"name": "appId", "type": "bytes32"}
-            ],
-            "name": "registerPeer",
-            "outputs": [],
-            "type": "function"
-        }, {
-            "inputs": [{"name": "instanceId", "type": "string"}],
-            "name": "registerInstance",
-            "outputs": [],
-            "type": "function"
-        }]
-        
-        # Load contract
-        contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=contract_abi)
-        print(f"✅ Contract loaded: {contract.address}")
+        print(f"✅ Contract: {CONTRACT_ADDRESS}")
         
         proof = test_data['proof']
         derived_pubkey_sec1 = test_data['derived_pubkey_sec1']
         app_pubkey_sec1 = test_data['app_pubkey_sec1']
-        
-        # Register instance first
+        app_id_bytes32 = test_data['app_id_bytes32']
         instance_id = "test_verification_instance"
-        print(f"📝 Registering instance: {instance_id}")
-        
-        try:
-            instance_tx = contract.functions.registerInstance(instance_id).transact({'from': account.address})
-            instance_receipt = w3.eth.wait_for_transaction_receipt(instance_tx)
-            print(f"✅ Instance registered: {instance_receipt.transactionHash.hex()}")
-        except Exception as e:
-            print(f"⚠️ Instance registration failed (may already exist): {e}")
-        
-        # Prepare parameters
-        app_id_bytes32 = bytes.fromhex(proof.app_id.replace('0x', '')).ljust(32, b'\x00')[:32]
         
         print(f"\n📋 Contract parameters:")
         print(f"   Instance ID: {instance_id}")
@@ -185,8 +167,29 @@ def test_contract_call(test_data):
         print(f"   Purpose: ethereum")
         print(f"   App ID: {app_id_bytes32.hex()}")
         
-        print(f"\n🚀 Calling registerPeer...")
-        tx_hash = contract.functions.registerPeer(
+        # registerInstance and registerPeer are signed locally with consecutive
+        # nonces, so both are submitted (and mined) together rather than one
+        # round trip after the other. Gas is fixed: registerPeer can't be
+        # estimated before the instance exists.
+        nonce, gas_price, chain_id = await asyncio.gather(
+            w3.eth.get_transaction_count(account.address, 'pending'),
+            w3.eth.gas_price,
+            w3.eth.chain_id,
+        )
+        
+        def sign(offset, data):
+            return account.sign_transaction({
+                'to': CONTRACT_ADDRESS,
+                'data': data,
+                'value': 0,
+                'gas': 2000000,
+                'gasPrice': gas_price,
+                'nonce': nonce + offset,
+                'chainId': chain_id,
+            }).rawTransaction  # eth-account is pinned to 0.9
+        
+        instance_raw = sign(0, REGISTER_INSTANCE_SELECTOR + abi_encode(['string'], [instance_id]))
+        peer_raw = sign(1, REGISTER_PEER_SELECTOR + abi_encode(REGISTER_PEER_TYPES, [
             instance_id,
             derived_pubkey_sec1,
             app_pubkey_sec1,
@@ -195,9 +198,26 @@ def test_contract_call(test_data):
             "http://localhost:8080",
             "ethereum",
             app_id_bytes32
-        ).transact({'from': account.address})
+        ]))
+        
+        print(f"\n🚀 Calling registerInstance + registerPeer...")
+        instance_tx, tx_hash = await asyncio.gather(
+            w3.eth.send_raw_transaction(instance_raw),
+            w3.eth.send_raw_transaction(peer_raw),
+        )
+        instance_receipt, receipt = await asyncio.gather(
+            w3.eth.wait_for_transaction_receipt(instance_tx),
+            w3.eth.wait_for_transaction_receipt(tx_hash),
+        )
         
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        if instance_receipt.status == 1:
+            print(f"✅ Instance registered: {instance_receipt.transactionHash.hex()}")
+        else:
+            print(f"⚠️ Instance registration reverted (may already exist): {instance_receipt.transactionHash.hex()}")
+        
+        if receipt.status != 1:
+            print(f"❌ registerPeer reverted: {receipt.transactionHash.hex()}")
+            return False
         print(f"✅ registerPeer succeeded: {receipt.transactionHash.hex()}")
         print(f"   Gas used: {receipt.gasUsed}")
         return True
@@ -218,7 +238,7 @@ def main():
     test_data = test_signature_formats()
     
     # Step 2: Test contract call if formats work
-    contract_success = test_contract_call(test_data) if test_data else False
+    contract_success = asyncio.run(test_contract_call(test_data)) if test_data else False
     
     # Summary
     print(f"\n" + "=" * 70)
@@ -5,7 +5,6 @@ Simple test script for DStack signature verification using signature_proof modul
 
 import sys
 import os
-import json
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from signature_proof import SignatureProofGenerator
 from eth_account import Account
@@ -19,7 +18,7 @@ def main():
     print(f"Expected KMS root: {KMS_ROOT_ADDRESS}")
     
     # Use signature_proof module for verification
-    generator = SignatureProofGenerator('./simulator/dstack.sock')
+    generator = SignatureProofGenerator.shared('./simulator/dstack.sock')
     
     try:
         # Generate proof
@@ -12,7 +12,7 @@ The test validates that DStack signatures can be verified on-chain.
 
 import requests
 import json
-from web3 import Web3
+from _w3 import get_w3
 
 # UPDATE THESE VALUES WITH YOUR DEPLOYMENT
 CONFIG = {
@@ -30,7 +30,7 @@ def get_kms_root_from_contract():
     
     try:
         # Connect to Base
-        w3 = Web3(Web3.HTTPProvider(CONFIG["rpc_url"]))
+        w3 = get_w3(CONFIG["rpc_url"])
         print(f"🔗 Base connection: {w3.is_connected()}")
         
         # KMS contract ABI for kmsInfo() function
@@ -93,9 +93,6 @@ def test_dstack_signatures():
     print(f"✅ CVM Logs received")
     
     # Look for JSON signature data in logs
-    import re
-    import json
-    
     # Remove timestamps and extract just the JSON content
     lines = logs_text.strip().split('\n')
     json_lines = []
@@ -131,7 +128,7 @@ def test_contract_verification(signature_data, kms_root):
     
     try:
         # Connect to Base
-        w3 = Web3(Web3.HTTPProvider(CONFIG["rpc_url"]))
+        w3 = get_w3(CONFIG["rpc_url"])
         print(f"🔗 Base connection: {w3.is_connected()}")
         print(f"📊 Block: {w3.eth.block_number}")
         
@@ -7,14 +7,22 @@ Simplified module for verifying DStack signature chains that prove:
 2. KMS Root signed the app key 
 """
 
+import binascii
+import functools
 import hashlib
 import os
 from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
 from dstack_sdk import DstackClient
 from eth_account import Account
-from eth_utils import keccak
+from eth_utils import keccak, to_checksum_address
 from eth_keys import keys
 
+try:
+    from coincurve import PrivateKey as _CoincurvePrivateKey, PublicKey as _CoincurvePublicKey
+except ImportError:  # coincurve is optional; fall back to eth_keys
+    _CoincurvePrivateKey = _CoincurvePublicKey = None
+
 @dataclass
 class SignatureProof:
     """Complete signature chain proof"""
@@ -23,36 +31,96 @@ class SignatureProof:
     kms_signature: bytes  # KMS signs app key
     purpose: str
     app_id: str
+    derived_public_key: bytes  # SEC1 compressed, derived from derived_private_key
+    app_public_key: bytes  # SEC1 compressed, recovered from app_signature
+
+def compressed_public_key(private_key: bytes) -> bytes:
+    """SEC1-compressed public key of a secp256k1 private key"""
+    if _CoincurvePrivateKey is not None:
+        return _CoincurvePrivateKey(private_key).public_key.format(compressed=True)
+    return keys.PrivateKey(private_key).public_key.to_compressed_bytes()
+
+def _coincurve_recover(signature: bytes, message_hash: bytes):
+    # libsecp256k1 expects the recovery id (0/1) in the last byte
+    if signature[64] >= 27:
+        signature = signature[:64] + bytes([signature[64] - 27])
+    return _CoincurvePublicKey.from_signature_and_message(signature, message_hash, hasher=None)
+
+def recover_compressed_pubkey(signature: bytes, message_hash: bytes) -> bytes:
+    """SEC1-compressed public key that produced a 65-byte recoverable signature over message_hash"""
+    if _CoincurvePublicKey is not None:
+        return _coincurve_recover(signature, message_hash).format(compressed=True)
+    return keys.Signature(signature).recover_public_key_from_msg_hash(message_hash).to_compressed_bytes()
+
+def recover_address(signature: bytes, message_hash: bytes) -> str:
+    """Checksummed address of the key that produced a 65-byte recoverable signature over message_hash"""
+    if _CoincurvePublicKey is not None:
+        uncompressed = _coincurve_recover(signature, message_hash).format(compressed=False)
+        return to_checksum_address(keccak(uncompressed[1:])[-20:])
+    return Account._recover_hash(message_hash, signature=signature)
+
+def recover_addresses(pairs: Iterable[Tuple[bytes, bytes]]) -> List[str]:
+    """recover_address over (signature, message_hash) pairs in one pass"""
+    return [recover_address(signature, message_hash) for signature, message_hash in pairs]
+
+def app_message_hash(purpose: str, derived_pubkey_sec1: bytes) -> bytes:
+    """Raw keccak256 of the "{purpose}:{derived_pubkey_sec1_hex}" message the app key signs"""
+    return keccak(purpose.encode() + b":" + binascii.hexlify(derived_pubkey_sec1))
 
 class SignatureProofGenerator:
     """Generates and verifies DStack signature chain proofs"""
     
-    def __init__(self, dstack_socket: str = None):
-        # Default to production socket, fallback to simulator
-        if dstack_socket is None:
-            if os.path.exists('/var/run/dstack.sock'):
-                dstack_socket = '/var/run/dstack.sock'
-            else:
-                dstack_socket = './simulator/dstack.sock'
-        self.client = DstackClient(dstack_socket)
+    def __init__(self, dstack_socket: str = None, client: DstackClient = None):
+        # Reuse the caller's DstackClient when given one
+        if client is not None:
+            self.client = client
+        else:
+            # Default to production socket, fallback to simulator
+            if dstack_socket is None:
+                if os.path.exists('/var/run/dstack.sock'):
+                    dstack_socket = '/var/run/dstack.sock'
+                else:
+                    dstack_socket = './simulator/dstack.sock'
+            self.client = DstackClient(dstack_socket)
+        # (derived_public_key, app_public_key) per key material, so repeated proofs
+        # for the same key path skip the secp256k1 work
+        self._pubkey_cache: Dict[bytes, Tuple[bytes, bytes]] = {}
+    
+    @classmethod
+    @functools.lru_cache(maxsize=4)
+    def shared(cls, dstack_socket: str = None) -> "SignatureProofGenerator":
+        """Process-wide generator per socket path, so repeated proofs reuse one client and pubkey cache"""
+        return cls(dstack_socket)
     
-    def generate_proof(self, key_path: str, purpose: str = "mainnet") -> SignatureProof:
-        """Generate complete signature chain proof"""
+    def generate_proof(self, key_path: str, purpose: str = "mainnet", info=None) -> SignatureProof:
+        """Generate complete signature chain proof (pass `info` to skip re-fetching instance info)"""
         # Get key and signature chain from DStack
         key_response = self.client.get_key(key_path, purpose)
-        info = self.client.info()
+        if info is None:
+            info = self.client.info()
         
         # Extract components
         derived_private_key = bytes.fromhex(key_response.key.replace('0x', ''))
         app_signature = bytes.fromhex(key_response.signature_chain[0].replace('0x', ''))
         kms_signature = bytes.fromhex(key_response.signature_chain[1].replace('0x', ''))
         
+        # Public keys in the compressed form the contract takes, computed once per key
+        cache_key = hashlib.blake2b(derived_private_key + app_signature, digest_size=16).digest()
+        pubkeys = self._pubkey_cache.get(cache_key)
+        if pubkeys is None:
+            derived_public_key = compressed_public_key(derived_private_key)
+            app_public_key = recover_compressed_pubkey(app_signature, app_message_hash(purpose, derived_public_key))
+            pubkeys = self._pubkey_cache[cache_key] = (derived_public_key, app_public_key)
+        derived_public_key, app_public_key = pubkeys
+        
         return SignatureProof(
             derived_private_key=derived_private_key,
             app_signature=app_signature,
             kms_signature=kms_signature,
             purpose=purpose,
-            app_id=info.app_id
+            app_id=info.app_id,
+            derived_public_key=derived_public_key,
+            app_public_key=app_public_key
         )
     
     def verify_proof(self, proof: SignatureProof, expected_kms_root: str) -> bool:
@@ -64,27 +132,22 @@ class SignatureProofGenerator:
         2. KMS root correctly signed the app key
         """
         try:
-            # Step 1: Verify app key signed derived key
+            # Step 1: Recover the app key from its signature over the derived key
             # Message format: "{purpose}:{derived_pubkey_sec1_hex}"
-            derived_public_key = keys.PrivateKey(proof.derived_private_key).public_key
-            derived_pubkey_sec1 = derived_public_key.to_compressed_bytes()
-            app_message = f"{proof.purpose}:{derived_pubkey_sec1.hex()}"
-            app_message_hash = keccak(text=app_message)
-            
-            app_signer = Account._recover_hash(app_message_hash, signature=proof.app_signature)
+            # Derived from the private key rather than trusting proof.derived_public_key
+            derived_pubkey_sec1 = compressed_public_key(proof.derived_private_key)
+            app_pubkey_sec1 = recover_compressed_pubkey(
+                proof.app_signature, app_message_hash(proof.purpose, derived_pubkey_sec1)
+            )
             
             # Step 2: Verify KMS signed app key  
             # Message format: "dstack-kms-issued:{app_id_bytes}{app_pubkey_sec1}"
             app_id_bytes = bytes.fromhex(proof.app_id.replace('0x', ''))
             
-            # Get app public key from recovered app signer
-            app_signature_obj = keys.Signature(proof.app_signature)
-            app_pubkey_sec1 = app_signature_obj.recover_public_key_from_msg_hash(app_message_hash).to_compressed_bytes()
-            
             kms_message = b"dstack-kms-issued:" + app_id_bytes + app_pubkey_sec1
             kms_message_hash = keccak(kms_message)
             
-            kms_signer = Account._recover_hash(kms_message_hash, signature=proof.kms_signature)
+            kms_signer = recover_address(proof.kms_signature, kms_message_hash)
             
             # Verify against expected KMS root
             return kms_signer.lower() == expected_kms_root.lower()
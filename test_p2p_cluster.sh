@@ -5,6 +5,30 @@ set -e
 CONTRACT_ADDRESS="${CONTRACT_ADDRESS:-0xa85233C63b9Ee964Add6F2cffe00Fd84eb32338f}"
 RPC_URL="${RPC_URL:-http://localhost:8545}"
 NUM_INSTANCES="${1:-3}"
+STARTUP_TIMEOUT="${STARTUP_TIMEOUT:-60}"  # Seconds to wait for each instance to come up
+CLUSTER_TIMEOUT="${CLUSTER_TIMEOUT:-15}"  # Seconds to wait for all instances to discover each other
+
+# Wait until an instance answers /info, polling every 100ms.
+# Fails early if its process exits, or after STARTUP_TIMEOUT seconds.
+wait_for_instance() {
+    local pid=$1 port=$2
+    local deadline=$((SECONDS + STARTUP_TIMEOUT))
+    until curl -sf "http://localhost:$port/info" > /dev/null 2>&1; do
+        if ! kill -0 "$pid" 2>/dev/null || [ "$SECONDS" -ge "$deadline" ]; then
+            return 1
+        fi
+        sleep 0.1
+    done
+}
+
+# True once every instance reports all the others in /peers
+cluster_formed() {
+    local expected=$((NUM_INSTANCES - 1)) i count
+    for i in $(seq 1 $NUM_INSTANCES); do
+        count=$(curl -sf "http://localhost:$((BASE_PORT + i - 1))/peers" 2>/dev/null | jq -r '.peers | length' 2>/dev/null)
+        [ "$count" = "$expected" ] || return 1
+    done
+}
 
 echo "=== Testing P2P Cluster with $NUM_INSTANCES instances ==="
 echo "Contract: $CONTRACT_ADDRESS"
@@ -45,8 +69,13 @@ for i in $(seq 1 $NUM_INSTANCES); do
     
     echo "Started $INSTANCE_ID (PID: $PID) on port $PORT"
     
-    # Brief pause between starts
-    sleep 3
+    # Wait until it is serving before starting the next one; run_hello_p2p.sh
+    # mints with the shared host key, so instances are brought up one at a time
+    if wait_for_instance "$PID" "$PORT"; then
+        echo "$INSTANCE_ID is up"
+    else
+        echo "⚠️  $INSTANCE_ID did not come up (see hello_${INSTANCE_ID}.log)"
+    fi
 done
 
 echo ""
@@ -59,8 +88,20 @@ done
 
 echo ""
 echo "=== Monitoring cluster formation ==="
-echo "Waiting 15 seconds for cluster to form..."
-sleep 15
+echo "Waiting up to ${CLUSTER_TIMEOUT} seconds for cluster to form..."
+# Poll with backoff (0.25s up to 2s) so a quickly formed cluster is checked right away
+DEADLINE=$((SECONDS + CLUSTER_TIMEOUT))
+DELAYS=(0.25 0.5 1 2)
+STEP=0
+until cluster_formed; do
+    if [ "$SECONDS" -ge "$DEADLINE" ]; then
+        break
+    fi
+    sleep "${DELAYS[STEP]}"
+    if [ "$STEP" -lt $((${#DELAYS[@]} - 1)) ]; then
+        STEP=$((STEP + 1))
+    fi
+done
 
 # Check peer discovery
 echo ""